@@ -0,0 +1,69 @@
+"""Compare the interval sweep collapse engine with the supernet-probing one.
+
+Usage: PYTHONPATH=. python benchmarks/bench_collapse.py [--sizes 100000 1000000]
+"""
+from __future__ import annotations
+
+import argparse
+import ipaddress
+import random
+import time
+from typing import List
+
+from generator.core import collapse_shadowed
+
+
+def _collapse_shadowed_supernets(
+    networks: List[ipaddress.IPv4Network],
+) -> List[ipaddress.IPv4Network]:
+    # Previous engine, kept here as the reference for timing and parity.
+    accepted: List[ipaddress.IPv4Network] = []
+    accepted_set: set[ipaddress.IPv4Network] = set()
+    for net in sorted(networks, key=lambda n: (n.prefixlen, int(n.network_address))):
+        shadowed = False
+        for plen in range(net.prefixlen - 1, -1, -1):
+            if net.supernet(new_prefix=plen) in accepted_set:
+                shadowed = True
+                break
+        if not shadowed:
+            accepted.append(net)
+            accepted_set.add(net)
+    return sorted(accepted, key=lambda n: (int(n.network_address), n.prefixlen))
+
+
+def synthetic_networks(count: int, seed: int = 1) -> List[ipaddress.IPv4Network]:
+    rng = random.Random(seed)
+    nets = []
+    for _ in range(count):
+        plen = rng.choice((12, 16, 18, 20, 22, 23, 24, 24, 24, 25, 28, 32))
+        # Keep addresses in a narrow range so that plenty of prefixes nest.
+        addr = rng.getrandbits(22) << 10
+        nets.append(ipaddress.IPv4Network((addr, plen), strict=False))
+    return nets
+
+
+def _timed(fn, nets):
+    start = time.perf_counter()
+    result = fn(nets)
+    return time.perf_counter() - start, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        nets = synthetic_networks(size)
+        old_s, old = _timed(_collapse_shadowed_supernets, nets)
+        new_s, new = _timed(collapse_shadowed, nets)
+        if old != new:
+            raise SystemExit(f"parity mismatch at size={size}")
+        print(
+            f"size={size} kept={len(new)} supernet={old_s:.2f}s "
+            f"sweep={new_s:.2f}s speedup={old_s / new_s:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Count ipaddress parse and str() calls made by one generate_resource run.
+
+Usage: PYTHONPATH=. python benchmarks/bench_parse_calls.py [--prefixes 5000]
+"""
+from __future__ import annotations
+
+import argparse
+import ipaddress
+import json
+from pathlib import Path
+import tempfile
+import time
+
+import responses
+
+from generator import core
+
+FEEDS = {
+    "plain_cidr": lambda prefixes: "\n".join(prefixes) + "\n",
+    "aws_ip_ranges_json": lambda prefixes: json.dumps(
+        {"prefixes": [{"ip_prefix": p, "service": "AMAZON"} for p in prefixes]}
+    ),
+}
+
+
+def synthetic_prefixes(count: int) -> list[str]:
+    return [f"{10 + i // 65536}.{(i // 256) % 256}.{i % 256}.0/24" for i in range(count)]
+
+
+class _Counter:
+    def __init__(self) -> None:
+        self.calls = {"parse": 0, "str": 0}
+        self._originals = {}
+
+    def _wrap(self, owner, name, kind):
+        original = getattr(owner, name)
+        self._originals[(owner, name)] = original
+
+        def counted(*args, **kwargs):
+            self.calls[kind] += 1
+            return original(*args, **kwargs)
+
+        setattr(owner, name, counted)
+
+    def __enter__(self) -> "_Counter":
+        self._wrap(ipaddress, "ip_network", "parse")
+        self._wrap(ipaddress.IPv4Network, "__init__", "parse")
+        self._wrap(ipaddress.IPv4Network, "__str__", "str")
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        for (owner, name), original in self._originals.items():
+            setattr(owner, name, original)
+
+
+def run(feed_format: str, count: int) -> None:
+    prefixes = synthetic_prefixes(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        base_dir = Path(tmp)
+        (base_dir / "resources").mkdir()
+        (base_dir / "resources" / "bench.yaml").write_text(
+            "resource_id: bench\n"
+            "source_type: url\n"
+            "url: https://example.com/feed\n"
+            f"format: {feed_format}\n"
+        )
+        with responses.RequestsMock() as mock:
+            mock.add(responses.GET, "https://example.com/feed", body=FEEDS[feed_format](prefixes))
+            with _Counter() as counter:
+                started = time.perf_counter()
+                core.generate_resource("bench", base_dir, collapse="shadowed")
+                elapsed = time.perf_counter() - started
+    print(
+        f"format={feed_format} prefixes={count} "
+        f"parse_calls={counter.calls['parse']} ({counter.calls['parse'] / count:.2f}/prefix) "
+        f"str_calls={counter.calls['str']} ({counter.calls['str'] / count:.2f}/prefix) "
+        f"elapsed={elapsed:.2f}s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prefixes", type=int, default=5000)
+    args = parser.parse_args()
+    for feed_format in FEEDS:
+        run(feed_format, args.prefixes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Bytes per prefix of a record list vs a PrefixSet; dedup/collapse time per backend.
+
+Usage: PYTHONPATH=. python benchmarks/bench_prefixset.py [--sizes 100000 1000000]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+import tracemalloc
+from typing import List, Tuple
+
+from generator import prefixset
+from generator.core import _collapse_shadowed
+from generator.prefixset import PrefixSet
+
+numpy = prefixset._np
+
+
+def synthetic_prefixes(count: int, seed: int = 1) -> List[Tuple[int, int]]:
+    # Full-table-like mix; addresses are spread so most values are not small ints.
+    rng = random.Random(seed)
+    prefixes = []
+    for _ in range(count):
+        plen = rng.choice((16, 19, 20, 22, 23, 24, 24, 24))
+        addr = rng.getrandbits(32) & (0xFFFFFFFF ^ (0xFFFFFFFF >> plen))
+        prefixes.append((addr, plen))
+    return prefixes
+
+
+def _retained(build) -> Tuple[object, float]:
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    value = build()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, after - before
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        raw = synthetic_prefixes(size)
+        # "+ 1 - 1" gives every record its own int object, as parsing a feed does.
+        records, list_bytes = _retained(lambda: sorted(set((a + 1 - 1, p) for a, p in raw)))
+        packed, set_bytes = _retained(lambda: PrefixSet(raw))
+        print(
+            f"prefixes={len(packed)} list={list_bytes / len(records):.1f}B/prefix "
+            f"prefixset={set_bytes / len(packed):.1f}B/prefix"
+        )
+
+        backends = [prefixset.backend()] + (["python"] if prefixset.backend() == "numpy" else [])
+        for name in backends:
+            if name == "python":
+                prefixset._np = None
+            started = time.perf_counter()
+            deduped = PrefixSet(raw)
+            dedup_s = time.perf_counter() - started
+            started = time.perf_counter()
+            collapsed = _collapse_shadowed(deduped)
+            collapse_s = time.perf_counter() - started
+            print(
+                f"prefixes={len(deduped)} backend={name} dedup={dedup_s:.2f}s "
+                f"collapse={collapse_s:.2f}s collapsed={len(collapsed)}"
+            )
+        prefixset._np = numpy
+
+if __name__ == "__main__":
+    main()
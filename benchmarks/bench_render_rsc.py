@@ -0,0 +1,102 @@
+"""Peak memory and time of writing dist/<resource>.rsc, join-and-read-back vs streaming.
+
+Also measures a whole generate_resource run that rewrites a published list and
+writes its delta (the fetch is replaced by a synthetic list).
+
+Usage: PYTHONPATH=. python benchmarks/bench_render_rsc.py [--sizes 100000 1000000]
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+from generator import core as gen_core
+from generator.core import (
+    ResourceConfig,
+    _RscCheck,
+    _prefix_digest,
+    _render_rsc,
+    _write_checked_rsc,
+)
+from generator.prefixset import PrefixSet
+
+
+def _write_joined(path: Path, resource: ResourceConfig, networks: PrefixSet, digest: str) -> None:
+    # Previous writer: whole file as one string, CR passes, then a read-back check.
+    contents = "\n".join(_render_rsc(resource, networks, digest)) + "\n"
+    contents = contents.replace("\r\n", "\n").replace("\r", "\n")
+    with open(path, "w", encoding="utf-8", newline="\n") as fh:
+        fh.write(contents)
+    check = _RscCheck({resource.resource_id})
+    for line in path.read_text().splitlines():
+        check.feed(line)
+    check.finish()
+
+
+def _write_streamed(path: Path, resource: ResourceConfig, networks: PrefixSet, digest: str) -> None:
+    _write_checked_rsc(path, _render_rsc(resource, networks, digest), {resource.resource_id})
+
+
+def synthetic_networks(count: int, offset: int = 0) -> PrefixSet:
+    return PrefixSet.from_sorted(((10 << 24) + ((i + offset) << 8), 24) for i in range(count))
+
+
+def _generate_with_delta(base_dir: Path, size: int) -> tuple[float, float]:
+    # First run publishes the list; the measured second run sees 1% of it
+    # replaced, so it reads the old file and writes the delta as well.
+    (base_dir / "resources").mkdir(parents=True, exist_ok=True)
+    (base_dir / "resources" / "bench.yaml").write_text(
+        "resource_id: bench\nsource_type: url\nurl: https://example.com\nformat: plain_cidr\n"
+    )
+    (base_dir / "dist" / "bench.rsc").unlink(missing_ok=True)
+    old, new = synthetic_networks(size), synthetic_networks(size, offset=size // 100)
+    with mock.patch.object(gen_core, "collect_networks", side_effect=[old, new]):
+        gen_core.generate_resource("bench", base_dir, rsc_style="compact")
+        tracemalloc.start()
+        started = time.perf_counter()
+        gen_core.generate_resource("bench", base_dir, rsc_style="compact")
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return peak, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    resource = ResourceConfig(
+        resource_id="bench", source_type="url", asns=None, url="https://example.com", format="plain_cidr"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.rsc.tmp"
+        for size in args.sizes:
+            networks = synthetic_networks(size)
+            digest = _prefix_digest(networks)
+            for name, fn in (("joined", _write_joined), ("streamed", _write_streamed)):
+                started = time.perf_counter()
+                fn(path, resource, networks, digest)
+                elapsed = time.perf_counter() - started
+                # Timed untraced; tracemalloc slows allocation-heavy code several times.
+                tracemalloc.start()
+                fn(path, resource, networks, digest)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(
+                    f"entries={size} mode={name} file={path.stat().st_size / 1024 / 1024:.1f}MB "
+                    f"peak={peak / 1024 / 1024:.1f}MB elapsed={elapsed:.2f}s"
+                )
+            peak, elapsed = _generate_with_delta(Path(tmp), size)
+            print(
+                f"entries={size} mode=generate_with_delta peak={peak / 1024 / 1024:.1f}MB "
+                f"elapsed={elapsed:.2f}s (traced)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Size and line length of dist .rsc files in the full vs compact style.
+
+Usage: PYTHONPATH=. python benchmarks/bench_rsc_size.py [--sizes 5000 50000] [--resource-id aws]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+
+from generator.core import RSC_STYLES, ResourceConfig, _prefix_digest, _render_rsc
+from generator.prefixset import PrefixSet
+
+
+def synthetic_networks(count: int, seed: int = 1) -> PrefixSet:
+    # Roughly the mix of a cloud feed: mostly /16-/24 with some host routes.
+    rng = random.Random(seed)
+    prefixes = []
+    for _ in range(count):
+        plen = rng.choice((16, 18, 20, 21, 22, 23, 24, 24, 24, 32))
+        prefixes.append((rng.getrandbits(32) & (0xFFFFFFFF ^ (0xFFFFFFFF >> plen)), plen))
+    return PrefixSet(prefixes)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5_000, 50_000])
+    parser.add_argument("--resource-id", default="aws")
+    args = parser.parse_args()
+
+    resource = ResourceConfig(
+        resource_id=args.resource_id, source_type="url", asns=None, url="https://example.com", format="plain_cidr"
+    )
+    for size in args.sizes:
+        networks = synthetic_networks(size)
+        digest = _prefix_digest(networks)
+        baseline = None
+        for style in RSC_STYLES:
+            lines = list(_render_rsc(resource, networks, digest, style))
+            size_bytes = sum(len(line) + 1 for line in lines)
+            adds = [line for line in lines if "add " in line]
+            baseline = baseline or size_bytes
+            print(
+                f"entries={len(networks)} style={style} bytes={size_bytes} "
+                f"ratio={size_bytes / baseline:.2f} "
+                f"avg_line={sum(map(len, adds)) / len(adds):.1f} max_line={max(map(len, adds))}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Peak memory of streaming vs full JSON parsing on a synthetic AWS feed.
+
+Usage: PYTHONPATH=. python benchmarks/bench_stream_json.py [--mb 50]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+import tempfile
+import time
+import tracemalloc
+
+from generator.core import FEED_FORMATS, _iter_file_chunks
+
+
+def write_synthetic_feed(path: Path, target_mb: int) -> int:
+    # Mostly IPv6 and service metadata, like the real ip-ranges.json.
+    ipv4 = 0
+    with open(path, "w") as fh:
+        fh.write('{"syncToken":"1700000000","createDate":"2026-01-01-00-00-00","prefixes":[')
+        for i in range(20_000):
+            if i:
+                fh.write(",")
+            fh.write(
+                json.dumps(
+                    {
+                        "ip_prefix": f"{3 + i // 65536}.{(i // 256) % 256}.{i % 256}.0/24",
+                        "region": "eu-central-1",
+                        "service": "AMAZON",
+                        "network_border_group": "eu-central-1",
+                    }
+                )
+            )
+            ipv4 += 1
+        fh.write('],"ipv6_prefixes":[')
+        i = 0
+        while fh.tell() < target_mb * 1024 * 1024:
+            if i:
+                fh.write(",")
+            fh.write(
+                json.dumps(
+                    {
+                        "ipv6_prefix": f"2600:1f{i % 256:02x}:{i % 65536:x}::/56",
+                        "region": "us-east-1",
+                        "service": "EC2",
+                        "network_border_group": "us-east-1",
+                    }
+                )
+            )
+            i += 1
+        fh.write("]}")
+    return ipv4
+
+
+def _full_parse(path: Path) -> int:
+    payload = json.loads(path.read_bytes())
+    return len([item["ip_prefix"] for item in payload["prefixes"] if "ip_prefix" in item])
+
+
+def _stream_parse(path: Path) -> int:
+    return len(list(FEED_FORMATS["aws_ip_ranges_json"].parse(_iter_file_chunks(path))))
+
+
+def _measure(fn, path: Path) -> tuple[int, float, float]:
+    tracemalloc.start()
+    started = time.perf_counter()
+    count = fn(path)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, peak / 1024 / 1024, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "ip-ranges.json"
+        ipv4 = write_synthetic_feed(path, args.mb)
+        size_mb = path.stat().st_size / 1024 / 1024
+        print(f"feed={size_mb:.1f}MB ipv4_prefixes={ipv4}")
+        for name, fn in (("full", _full_parse), ("stream", _stream_parse)):
+            count, peak, elapsed = _measure(fn, path)
+            print(f"mode={name} prefixes={count} peak={peak:.1f}MB elapsed={elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,149 @@ from __future__ import annotations
 import argparse
 from pathlib import Path
 import sys
+import time
 
 from .core import (
+    COLLAPSE_MODES,
+    DIST_FORMATS,
+    RSC_STYLES,
+    DEFAULT_BACKOFF_BASE,
+    DEFAULT_BACKOFF_MAX,
+    DEFAULT_JOBS,
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_RETRIES,
+    DEFAULT_RETRY_BUDGET,
+    MAX_PART_BYTES,
     GeneratorError,
+    HttpClient,
+    ResourceResult,
+    RetryPolicy,
+    analyze_resource,
     generate_all,
     generate_resource,
-    reset_stale_cache_used,
-    stale_cache_used,
 )
+from .loaders import generate_bundles, generate_loaders
+
+
+def _positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}") from exc
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be >= 1")
+    return number
+
+
+def _non_negative_float(value: str) -> float:
+    try:
+        number = float(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"invalid float value: {value!r}") from exc
+    if number < 0:
+        raise argparse.ArgumentTypeError("must be >= 0")
+    return number
+
+
+def _dist_formats(value: str) -> tuple[str, ...]:
+    formats = tuple(fmt.strip() for fmt in value.split(",") if fmt.strip())
+    unknown = [fmt for fmt in formats if fmt not in DIST_FORMATS]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown format(s) {', '.join(unknown)}; choose from {', '.join(DIST_FORMATS)}"
+        )
+    return formats
+
+
+def _add_http_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--max-connections-per-host",
+        type=_positive_int,
+        default=DEFAULT_POOL_MAXSIZE,
+        help=f"pooled keep-alive connections per host (default: {DEFAULT_POOL_MAXSIZE})",
+    )
+    parser.add_argument(
+        "--retries",
+        type=_positive_int,
+        default=DEFAULT_RETRIES,
+        help=f"attempts per request on 429/5xx/connection errors (default: {DEFAULT_RETRIES})",
+    )
+    parser.add_argument(
+        "--backoff-base",
+        type=_non_negative_float,
+        default=DEFAULT_BACKOFF_BASE,
+        help=f"first retry delay in seconds, doubled per attempt (default: {DEFAULT_BACKOFF_BASE})",
+    )
+    parser.add_argument(
+        "--backoff-max",
+        type=_non_negative_float,
+        default=DEFAULT_BACKOFF_MAX,
+        help=f"cap for a single backoff delay in seconds (default: {DEFAULT_BACKOFF_MAX})",
+    )
+    parser.add_argument(
+        "--retry-budget",
+        type=_non_negative_float,
+        default=DEFAULT_RETRY_BUDGET,
+        help=(
+            "total seconds a resource may spend on retries; Retry-After beyond it "
+            f"gives up (default: {DEFAULT_RETRY_BUDGET})"
+        ),
+    )
+
+
+def _add_rsc_style_arg(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--rsc-style",
+        choices=RSC_STYLES,
+        default="full",
+        help=(
+            "full: every add line carries /ip/firewall/address-list; compact: enter "
+            "the menu once and write short add lines (default: full)"
+        ),
+    )
+
+
+def _add_chunk_entries_arg(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--chunk-entries",
+        type=_positive_int,
+        help=(
+            "also split each list into <id>.partNN.rsc files of at most N entries "
+            f"(and at most {MAX_PART_BYTES} bytes) plus <id>.manifest.rsc, "
+            "for loaders with chunked: true"
+        ),
+    )
+
+
+def _add_asn_cache_ttl_arg(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--asn-cache-ttl",
+        type=_non_negative_float,
+        default=0.0,
+        help=(
+            "with --allow-cache, reuse a cached RIPEstat answer without a request "
+            "while its query_time is younger than this many seconds (default: 0)"
+        ),
+    )
+
+
+def _http_client(args: argparse.Namespace) -> HttpClient:
+    retry = RetryPolicy(
+        retries=args.retries,
+        backoff_base=args.backoff_base,
+        backoff_max=args.backoff_max,
+        budget=args.retry_budget,
+    )
+    return HttpClient(pool_maxsize=args.max_connections_per_host, retry=retry)
+
+
+def _print_http_summary(client: HttpClient) -> None:
+    stats = client.stats()
+    print(
+        f"event=http_summary requests={stats['requests']} "
+        f"connections={stats['connections']} reused={stats['reused']}"
+    )
 
 
 def _parse_args(argv: list[str]) -> argparse.Namespace:
@@ -24,23 +159,123 @@ def _parse_args(argv: list[str]) -> argparse.Namespace:
     gen.add_argument(
         "--allow-cache",
         action="store_true",
-        help="allow using cached URL responses only on HTTP 304",
+        help="allow using cached URL/RIPEstat responses only on HTTP 304",
     )
     gen.add_argument(
         "--allow-stale-cache",
         action="store_true",
-        help="allow using cached URL responses on non-200/timeout (stale)",
+        help="allow using cached URL/RIPEstat responses on non-200/timeout (stale)",
     )
     gen.add_argument(
         "--collapse",
-        choices=["none", "shadowed"],
+        choices=COLLAPSE_MODES,
         default="shadowed",
-        help="optional prefix collapse mode (default: shadowed)",
+        help=(
+            "prefix collapse mode: drop shadowed subnets, or also merge siblings "
+            "into exact aggregates (default: shadowed)"
+        ),
+    )
+    gen.add_argument(
+        "--max-entries",
+        type=_positive_int,
+        help=(
+            "with --collapse=aggregate, merge into covering supernets (cheapest first) "
+            "until at most N entries remain; may cover extra addresses"
+        ),
+    )
+    gen.add_argument(
+        "--formats",
+        type=_dist_formats,
+        default=(),
+        help=(
+            "also write dist/<resource>.<fmt> from the same list, comma-separated: "
+            f"{','.join(DIST_FORMATS)} (default: none)"
+        ),
     )
+    _add_rsc_style_arg(gen)
+    _add_chunk_entries_arg(gen)
+    _add_asn_cache_ttl_arg(gen)
+    gen.add_argument(
+        "--max-concurrency",
+        type=_positive_int,
+        default=DEFAULT_MAX_CONCURRENCY,
+        help=f"parallel ASN lookups per resource (default: {DEFAULT_MAX_CONCURRENCY})",
+    )
+    gen.add_argument(
+        "--jobs",
+        type=_positive_int,
+        default=DEFAULT_JOBS,
+        help=f"resources generated in parallel with --all (default: {DEFAULT_JOBS})",
+    )
+    _add_http_args(gen)
+
+    analyze = sub.add_parser("analyze", help="report shadowed prefixes without writing dist")
+    analyze.add_argument("--resource", required=True, help="resource_id to analyze")
+    analyze.add_argument("--base-dir", default=".", help="repository base dir")
+    analyze.add_argument(
+        "--allow-cache",
+        action="store_true",
+        help="allow using cached URL/RIPEstat responses only on HTTP 304",
+    )
+    analyze.add_argument(
+        "--allow-stale-cache",
+        action="store_true",
+        help="allow using cached URL/RIPEstat responses on non-200/timeout (stale)",
+    )
+    _add_asn_cache_ttl_arg(analyze)
+    analyze.add_argument(
+        "--max-concurrency",
+        type=_positive_int,
+        default=DEFAULT_MAX_CONCURRENCY,
+        help=f"parallel ASN lookups per resource (default: {DEFAULT_MAX_CONCURRENCY})",
+    )
+    _add_http_args(analyze)
+    analyze.add_argument(
+        "--top", type=int, default=20, help="number of offending supernets to list (default: 20)"
+    )
+
+    loaders = sub.add_parser(
+        "loaders", help="render routeros/loader_<region>.rsc from regions.yaml"
+    )
+    loaders.add_argument("--region", help="region to render (default: all)")
+    loaders.add_argument("--base-dir", default=".", help="repository base dir")
+
+    bundles = sub.add_parser(
+        "bundles", help="merge each region's dist/*.rsc into dist/bundle_<region>.rsc"
+    )
+    bundles.add_argument("--region", help="region to bundle (default: all)")
+    bundles.add_argument("--base-dir", default=".", help="repository base dir")
+    _add_rsc_style_arg(bundles)
+    _add_chunk_entries_arg(bundles)
 
     return parser.parse_args(argv)
 
 
+def _print_summary(results: list[ResourceResult], elapsed: float) -> None:
+    for r in results:
+        if r.ok:
+            print(
+                f"event=resource_done resource={r.resource_id} status=ok "
+                f"count={r.count} changed={str(r.changed).lower()} "
+                f"overcovered={r.overcovered} elapsed={r.elapsed:.2f}s"
+            )
+        else:
+            print(
+                f"event=resource_done resource={r.resource_id} status=failed "
+                f"elapsed={r.elapsed:.2f}s"
+            )
+            print(f"error: {r.resource_id}: {r.error}", file=sys.stderr)
+
+    failed = [r.resource_id for r in results if not r.ok]
+    changed = [r.resource_id for r in results if r.changed]
+    print(
+        f"event=run_summary resources={len(results)} ok={len(results) - len(failed)} "
+        f"failed={len(failed)} entries={sum(r.count for r in results)} changed={len(changed)} "
+        f"elapsed={elapsed:.2f}s failed_resources={','.join(failed) or '-'} "
+        f"changed_resources={','.join(changed) or '-'}"
+    )
+
+
 def main(argv: list[str]) -> int:
     args = _parse_args(argv)
 
@@ -48,30 +283,120 @@ def main(argv: list[str]) -> int:
         if bool(args.resource) == bool(args.all):
             print("error: specify --resource or --all", file=sys.stderr)
             return 2
+        if args.max_entries is not None and args.collapse != "aggregate":
+            print("error: --max-entries requires --collapse=aggregate", file=sys.stderr)
+            return 2
 
         base_dir = Path(args.base_dir).resolve()
-        reset_stale_cache_used()
+        started = time.monotonic()
+        client = _http_client(args)
         try:
             if args.all:
-                generate_all(
+                results = generate_all(
                     base_dir,
                     allow_cache=args.allow_cache,
                     allow_stale_cache=args.allow_stale_cache,
                     collapse=args.collapse,
+                    max_concurrency=args.max_concurrency,
+                    jobs=args.jobs,
+                    client=client,
+                    max_entries=args.max_entries,
+                    asn_cache_ttl=args.asn_cache_ttl,
+                    formats=args.formats,
+                    rsc_style=args.rsc_style,
+                    chunk_entries=args.chunk_entries,
                 )
             else:
-                generate_resource(
-                    args.resource,
-                    base_dir,
-                    allow_cache=args.allow_cache,
-                    allow_stale_cache=args.allow_stale_cache,
-                    collapse=args.collapse,
-                )
-            if args.allow_stale_cache and stale_cache_used():
-                print("CACHE_STALE_USED=true")
+                result = ResourceResult(resource_id=args.resource)
+                try:
+                    generate_resource(
+                        args.resource,
+                        base_dir,
+                        allow_cache=args.allow_cache,
+                        allow_stale_cache=args.allow_stale_cache,
+                        collapse=args.collapse,
+                        max_concurrency=args.max_concurrency,
+                        result=result,
+                        client=client,
+                        max_entries=args.max_entries,
+                        asn_cache_ttl=args.asn_cache_ttl,
+                        formats=args.formats,
+                        rsc_style=args.rsc_style,
+                        chunk_entries=args.chunk_entries,
+                    )
+                except GeneratorError as exc:
+                    result.error = str(exc)
+                result.elapsed = time.monotonic() - started
+                results = [result]
         except GeneratorError as exc:
             print(f"error: {exc}", file=sys.stderr)
             return 1
+        finally:
+            _print_http_summary(client)
+            client.close()
+
+        _print_summary(results, time.monotonic() - started)
+        if args.allow_stale_cache and any(r.stale_cache_used for r in results):
+            print("CACHE_STALE_USED=true")
+        if any(not r.ok for r in results):
+            return 1
+
+    if args.command == "analyze":
+        base_dir = Path(args.base_dir).resolve()
+        client = _http_client(args)
+        try:
+            total, shadowed, offenders = analyze_resource(
+                args.resource,
+                base_dir,
+                allow_cache=args.allow_cache,
+                allow_stale_cache=args.allow_stale_cache,
+                max_concurrency=args.max_concurrency,
+                client=client,
+                asn_cache_ttl=args.asn_cache_ttl,
+            )
+        except GeneratorError as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 1
+        finally:
+            client.close()
+
+        print(f"resource={args.resource} total={total} shadowed={shadowed} offenders={len(offenders)}")
+        ranked = sorted(offenders.items(), key=lambda item: (-item[1], item[0]))
+        for supernet, count in ranked[: max(args.top, 0)]:
+            print(f"offender={supernet} shadowed={count}")
+
+    if args.command == "bundles":
+        base_dir = Path(args.base_dir).resolve()
+        started = time.monotonic()
+        try:
+            results = generate_bundles(
+                base_dir,
+                region=args.region,
+                rsc_style=args.rsc_style,
+                chunk_entries=args.chunk_entries,
+            )
+        except GeneratorError as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 1
+
+        _print_summary(results, time.monotonic() - started)
+        if any(not r.ok for r in results):
+            return 1
+
+    if args.command == "loaders":
+        base_dir = Path(args.base_dir).resolve()
+        try:
+            results = generate_loaders(base_dir, region=args.region)
+        except GeneratorError as exc:
+            print(f"error: {exc}", file=sys.stderr)
+            return 1
+
+        for r in results:
+            print(
+                f"event=loader_done region={r.region} path={r.path.relative_to(base_dir)} "
+                f"resources={r.resources} entries={r.entries} bytes={r.bytes} "
+                f"missing={','.join(r.missing) or '-'}"
+            )
 
     return 0
 
@@ -1,20 +1,85 @@
 from __future__ import annotations
 
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
 from dataclasses import dataclass
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from itertools import islice
 from pathlib import Path
+import codecs
+import hashlib
+import heapq
 import ipaddress
 import json
 import os
-from typing import Iterable, List, Optional, Tuple
+import random
+import re
+import struct
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
 import yaml
 
+from .jsonstream import JsonStream
+from .prefixcache import ParsedPrefixCache
+from .prefixset import PrefixSet
+
 RIPESTAT_URL = "https://stat.ripe.net/data/announced-prefixes/data.json"
 DEFAULT_TIMEOUT: Tuple[float, float] = (5.0, 20.0)
 DEFAULT_RETRIES = 3
-_STALE_CACHE_USED = False
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_MAX = 30.0
+DEFAULT_RETRY_BUDGET = 300.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_JOBS = 1
+COLLAPSE_MODES = ("none", "shadowed", "aggregate")
+# Optional dist/<resource>.<ext> files written next to the .rsc for non-RouterOS consumers.
+DIST_FORMATS = ("txt", "nft", "ipset", "bin")
+# "full" spells out /ip/firewall/address-list on every add; "compact" enters the
+# menu once (as /export does) and writes hosts without /32.
+RSC_STYLES = ("full", "compact")
+# Part files are named <id>.partNN.rsc, which loaders rebuild from the count.
+MAX_CHUNK_PARTS = 99
+# Loaders validate a part through /file get ... contents, which RouterOS v7
+# caps at 64 KiB; parts stay below that whatever the entry count.
+MAX_PART_BYTES = 60_000
+DEFAULT_POOL_MAXSIZE = 8
+DEFAULT_POOL_HOSTS = 16
+STREAM_CHUNK_SIZE = 64 * 1024
+PARSED_CACHE_MAX_BYTES = 64 * 1024 * 1024
+_IPV4_ALL_ONES = 0xFFFFFFFF
+
+# Dotted quad without leading zeros plus an optional 0-32 length, i.e. the
+# subset of ipaddress' accepted syntax that _parse_ipv4 decodes by itself.
+_IPV4_OCTET = r"(25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])"
+_IPV4_CIDR_RE = re.compile(
+    rf"{_IPV4_OCTET}\.{_IPV4_OCTET}\.{_IPV4_OCTET}\.{_IPV4_OCTET}(?:/(3[0-2]|[12]?[0-9]|0[0-9]))?"
+)
+
+# .bin layout: magic, format version, entry count, sha256 of the list (the
+# "# sha256=" of the .rsc), then one (start, prefixlen) record per entry in
+# address order. All big-endian.
+_BIN_MAGIC = b"IPLB"
+_BIN_VERSION = 1
+_BIN_HEADER = struct.Struct(">4sBI32s")
+_BIN_RECORD = struct.Struct(">IB")
+# ipset hash:net takes /1../32 (and needs maxelem >= entries).
+_IPSET_MIN_MAXELEM = 65536
+
+_RSC_ADDRESS_RE = re.compile(r"\baddress=(\S+)")
+_RSC_TAG_RE = re.compile(r'\bcomment="iplist:auto:([^"]*)"')
+
+# Parsed IPv4 prefix: (network address as int, prefix length). Everything after
+# the feed extractors works on these records; ordering is (address, length).
+Prefix = Tuple[int, int]
 
 
 @dataclass(frozen=True)
@@ -26,10 +91,51 @@ class ResourceConfig:
     format: Optional[str]
 
 
+@dataclass
+class ResourceResult:
+    resource_id: str
+    path: Optional[Path] = None
+    count: int = 0
+    elapsed: float = 0.0
+    stale_cache_used: bool = False
+    changed: bool = False
+    overcovered: int = 0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
 class GeneratorError(RuntimeError):
     pass
 
 
+@dataclass(frozen=True)
+class RetryPolicy:
+    retries: int = DEFAULT_RETRIES
+    backoff_base: float = DEFAULT_BACKOFF_BASE
+    backoff_max: float = DEFAULT_BACKOFF_MAX
+    # Total time budget (seconds) for all requests of one resource; None = unlimited.
+    budget: Optional[float] = DEFAULT_RETRY_BUDGET
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        # "Equal jitter": half of the exponential step is fixed, half is random.
+        step = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = step / 2 + random.uniform(0, step / 2)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def deadline(self) -> Optional[float]:
+        if self.budget is None:
+            return None
+        return time.monotonic() + self.budget
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
 def _iso_utc_now() -> str:
     return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
@@ -65,13 +171,7 @@ def load_resource_config(path: Path) -> ResourceConfig:
 
     if not url or not isinstance(url, str):
         raise GeneratorError(f"invalid url in {path}")
-    if feed_format not in {
-        "aws_ip_ranges_json",
-        "plain_cidr",
-        "json_prefix_list",
-        "google_cloud_json",
-        "fastly_public_ip_list_json",
-    }:
+    if feed_format not in FEED_FORMATS:
         raise GeneratorError(f"invalid format in {path}")
     if asns:
         raise GeneratorError(f"unexpected asns for url source in {path}")
@@ -81,43 +181,149 @@ def load_resource_config(path: Path) -> ResourceConfig:
     )
 
 
+def _accept_encoding() -> str:
+    # Only advertise brotli when urllib3 can decode it (brotli package installed).
+    encodings = ["gzip"]
+    if "br" in ACCEPT_ENCODING.split(","):
+        encodings.append("br")
+    return ", ".join(encodings)
+
+
+class HttpClient:
+    """Pooled keep-alive session shared by every request of a run."""
+
+    def __init__(
+        self,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        pool_hosts: int = DEFAULT_POOL_HOSTS,
+        retry: Optional[RetryPolicy] = None,
+    ) -> None:
+        self.retry = retry if retry is not None else DEFAULT_RETRY_POLICY
+        self.session = requests.Session()
+        # pool_block caps open connections per host at pool_maxsize.
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_hosts, pool_maxsize=pool_maxsize, pool_block=True
+        )
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self.session.headers["Accept-Encoding"] = _accept_encoding()
+        self._lock = threading.Lock()
+        self._requests = 0
+
+    def get(
+        self,
+        url: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        **kwargs,
+    ) -> requests.Response:
+        with self._lock:
+            self._requests += 1
+        return self.session.get(
+            url, params=params, headers=headers, timeout=DEFAULT_TIMEOUT, **kwargs
+        )
+
+    def stats(self) -> Dict[str, int]:
+        connections = 0
+        pooled_requests = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            pooled_requests += pool.num_requests
+        return {
+            "requests": self._requests,
+            "connections": connections,
+            "reused": max(pooled_requests - connections, 0),
+        }
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> "HttpClient":
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+
+def _retry_after_seconds(resp: Optional[requests.Response]) -> Optional[float]:
+    if resp is None:
+        return None
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
 def _request_with_retries(
+    client: HttpClient,
     url: str,
     params: Optional[dict] = None,
     headers: Optional[dict] = None,
-    retries: int = DEFAULT_RETRIES,
+    deadline: Optional[float] = None,
+    stream: bool = False,
 ) -> requests.Response:
+    policy = client.retry
     last_exc: Optional[Exception] = None
-    for attempt in range(retries):
+    for attempt in range(policy.retries):
+        resp: Optional[requests.Response] = None
         try:
-            resp = requests.get(url, params=params, headers=headers, timeout=DEFAULT_TIMEOUT)
+            resp = client.get(url, params=params, headers=headers, stream=stream)
         except requests.exceptions.RequestException as exc:
             last_exc = exc
-            continue
-        if resp.status_code in {500, 502, 503, 504, 429} and attempt < retries - 1:
-            continue
-        return resp
+        if resp is not None and (
+            resp.status_code not in RETRY_STATUSES or attempt == policy.retries - 1
+        ):
+            return resp
+        if attempt == policy.retries - 1:
+            break
+
+        delay = policy.delay(attempt, _retry_after_seconds(resp))
+        if deadline is not None and time.monotonic() + delay > deadline:
+            print(f"event=retry_budget_exhausted url={url} attempt={attempt + 1}", flush=True)
+            if resp is not None:
+                return resp
+            break
+        reason = f"status={resp.status_code}" if resp is not None else "error"
+        if resp is not None:
+            resp.close()
+        print(
+            f"event=http_retry url={url} attempt={attempt + 1} {reason} delay={delay:.2f}s",
+            flush=True,
+        )
+        time.sleep(delay)
     raise GeneratorError(f"request failed for {url}") from last_exc
 
 
-def _mark_stale_cache_used(reason: str, url: str, status: Optional[int] = None) -> None:
-    global _STALE_CACHE_USED
-    _STALE_CACHE_USED = True
+def _mark_stale_cache_used(
+    result: Optional[ResourceResult], reason: str, url: str, status: Optional[int] = None
+) -> None:
+    if result is not None:
+        result.stale_cache_used = True
     suffix = f" status={status}" if status is not None else ""
     print(f"event=cache_stale_used reason={reason} url={url}{suffix}", flush=True)
 
 
-def stale_cache_used() -> bool:
-    return _STALE_CACHE_USED
-
-
-def reset_stale_cache_used() -> None:
-    global _STALE_CACHE_USED
-    _STALE_CACHE_USED = False
-
-
-def _fetch_json(url: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> dict:
-    resp = _request_with_retries(url, params=params, headers=headers)
+def _fetch_json(
+    client: HttpClient,
+    url: str,
+    params: Optional[dict] = None,
+    headers: Optional[dict] = None,
+    deadline: Optional[float] = None,
+) -> dict:
+    resp = _request_with_retries(client, url, params=params, headers=headers, deadline=deadline)
 
     if resp.status_code != 200:
         raise GeneratorError(f"non-200 from {url}: {resp.status_code}")
@@ -128,47 +334,94 @@ def _fetch_json(url: str, params: Optional[dict] = None, headers: Optional[dict]
         raise GeneratorError("malformed JSON response") from exc
 
 
-def _fetch_text(url: str, headers: Optional[dict] = None) -> str:
-    resp = _request_with_retries(url, headers=headers)
+def _fetch_text(
+    client: HttpClient,
+    url: str,
+    headers: Optional[dict] = None,
+    deadline: Optional[float] = None,
+) -> str:
+    resp = _request_with_retries(client, url, headers=headers, deadline=deadline)
 
     if resp.status_code != 200:
         raise GeneratorError(f"non-200 from {url}: {resp.status_code}")
     return resp.text
 
 
-def _extract_prefixes(payload: dict) -> List[str]:
+def _parse_ipv4_slow(value: object) -> Optional[Prefix]:
+    net = ipaddress.ip_network(value, strict=False)  # type: ignore[arg-type]
+    if net.version != 4:
+        return None
+    return int(net.network_address), net.prefixlen
+
+
+def _parse_ipv4(value: object) -> Optional[Prefix]:
+    """Parse a prefix with strict=False semantics; None for IPv6, ValueError if malformed.
+
+    Plain "a.b.c.d/n" and "a.b.c.d" are decoded directly; anything else
+    (IPv6, netmask notation, odd spellings, errors) goes through ipaddress.
+    """
+    match = _IPV4_CIDR_RE.fullmatch(value) if type(value) is str else None
+    if match is None:
+        return _parse_ipv4_slow(value)
+    a, b, c, d, plen_str = match.groups()
+    plen = 32 if plen_str is None else int(plen_str)
+    addr = (int(a) << 24) | (int(b) << 16) | (int(c) << 8) | int(d)
+    return addr & (_IPV4_ALL_ONES ^ (_IPV4_ALL_ONES >> plen)), plen
+
+
+def _parse_ipv4_lenient(value: object) -> Optional[Prefix]:
+    try:
+        return _parse_ipv4(value)
+    except ValueError:
+        return None
+
+
+def _format_prefix(prefix: Prefix) -> str:
+    addr, plen = prefix
+    return f"{addr >> 24}.{(addr >> 16) & 255}.{(addr >> 8) & 255}.{addr & 255}/{plen}"
+
+
+def _extract_prefixes(payload: dict) -> List[Prefix]:
     data = payload.get("data") if isinstance(payload, dict) else None
     prefixes = data.get("prefixes") if isinstance(data, dict) else None
 
     if not prefixes:
         raise GeneratorError("empty prefixes")
 
-    result: List[str] = []
+    result: List[Prefix] = []
     for item in prefixes:
-        if isinstance(item, str):
-            result.append(item)
-        elif isinstance(item, dict) and "prefix" in item:
-            result.append(item["prefix"])
+        if isinstance(item, dict) and "prefix" in item:
+            item = item["prefix"]
+        elif not isinstance(item, str):
+            continue
+        record = _parse_ipv4_lenient(item)
+        if record is not None:
+            result.append(record)
     return result
 
 
-def _extract_aws_prefixes(payload: dict) -> List[str]:
-    if not isinstance(payload, dict):
+def _stream_aws_prefixes(stream: JsonStream) -> Iterator[Prefix]:
+    if stream.peek() != "{":
         raise GeneratorError("malformed JSON response")
-    prefixes = payload.get("prefixes")
-    if not prefixes:
+    found = False
+    for key in stream.keys():
+        if key != "prefixes" or stream.peek() != "[":
+            stream.skip()
+            continue
+        for item in stream.items():
+            found = True
+            if isinstance(item, dict) and "ip_prefix" in item:
+                record = _parse_ipv4_lenient(item["ip_prefix"])
+                if record is not None:
+                    yield record
+    stream.finish()
+    if not found:
         raise GeneratorError("empty prefixes")
 
-    result: List[str] = []
-    for item in prefixes:
-        if isinstance(item, dict) and "ip_prefix" in item:
-            result.append(item["ip_prefix"])
-    return result
 
-
-def _extract_plain_cidr(text: str) -> List[str]:
-    prefixes = []
-    for line in text.splitlines():
+def _stream_plain_cidr(lines: Iterable[str]) -> Iterator[Prefix]:
+    found = False
+    for line in lines:
         line = line.strip()
         if not line or line.startswith("#"):
             continue
@@ -179,425 +432,1725 @@ def _extract_plain_cidr(text: str) -> List[str]:
         parts = line.split()
         for part in parts:
             try:
-                net = ipaddress.ip_network(part, strict=False)
+                record = _parse_ipv4(part)
             except ValueError as exc:
                 raise GeneratorError("malformed CIDR in plain_cidr feed") from exc
-            if net.version == 4:
-                prefixes.append(part)
-    if not prefixes:
+            if record is not None:
+                found = True
+                yield record
+    if not found:
         raise GeneratorError("empty prefixes")
-    return prefixes
 
 
-def _extract_json_prefix_list(payload: object) -> List[str]:
-    if isinstance(payload, list):
-        prefixes = [p for p in payload if isinstance(p, str)]
-    elif isinstance(payload, dict):
-        raw = payload.get("prefixes")
-        if isinstance(raw, list):
-            prefixes = []
-            for item in raw:
-                if isinstance(item, str):
-                    prefixes.append(item)
-                elif isinstance(item, dict) and "prefix" in item:
-                    prefixes.append(item["prefix"])
-        else:
-            prefixes = []
+def _stream_json_prefix_list(stream: JsonStream) -> Iterator[Prefix]:
+    found = False
+    head = stream.peek()
+    if head == "[":
+        for item in stream.items():
+            if isinstance(item, str):
+                found = True
+                record = _parse_ipv4_lenient(item)
+                if record is not None:
+                    yield record
+    elif head == "{":
+        for key in stream.keys():
+            if key != "prefixes" or stream.peek() != "[":
+                stream.skip()
+                continue
+            for item in stream.items():
+                if isinstance(item, dict) and "prefix" in item:
+                    item = item["prefix"]
+                elif not isinstance(item, str):
+                    continue
+                found = True
+                record = _parse_ipv4_lenient(item)
+                if record is not None:
+                    yield record
     else:
-        prefixes = []
+        stream.skip()
+    stream.finish()
+    if not found:
+        raise GeneratorError("empty prefixes")
 
-    if not prefixes:
+
+def _stream_google_cloud_prefixes(stream: JsonStream) -> Iterator[Prefix]:
+    if stream.peek() != "{":
+        raise GeneratorError("malformed JSON response")
+    found = False
+    for key in stream.keys():
+        if key != "prefixes" or stream.peek() != "[":
+            stream.skip()
+            continue
+        for item in stream.items():
+            found = True
+            if isinstance(item, dict) and "ipv4Prefix" in item:
+                record = _parse_ipv4_lenient(item["ipv4Prefix"])
+                if record is not None:
+                    yield record
+    stream.finish()
+    if not found:
         raise GeneratorError("empty prefixes")
-    return prefixes
 
 
-def _extract_google_cloud_prefixes(payload: dict) -> List[str]:
-    if not isinstance(payload, dict):
+def _stream_fastly_prefixes(stream: JsonStream) -> Iterator[Prefix]:
+    if stream.peek() != "{":
         raise GeneratorError("malformed JSON response")
-    prefixes = payload.get("prefixes")
-    if not prefixes:
+    found = False
+    for key in stream.keys():
+        if key != "addresses":
+            stream.skip()
+            continue
+        if stream.peek() != "[":
+            # Only an empty value ("", null, {}) reads as an empty feed.
+            if stream.value():
+                raise GeneratorError("malformed JSON response")
+            continue
+        for item in stream.items():
+            found = True
+            if not isinstance(item, str):
+                raise GeneratorError("malformed CIDR in fastly feed")
+            try:
+                record = _parse_ipv4(item)
+            except ValueError as exc:
+                raise GeneratorError("malformed CIDR in fastly feed") from exc
+            if record is not None:
+                yield record
+    stream.finish()
+    if not found:
         raise GeneratorError("empty prefixes")
-    result: List[str] = []
-    for item in prefixes:
-        if isinstance(item, dict) and "ipv4Prefix" in item:
-            result.append(item["ipv4Prefix"])
-    return result
 
 
-def _extract_fastly_prefixes(payload: dict) -> List[str]:
-    if not isinstance(payload, dict):
+def _stream_oracle_prefixes(stream: JsonStream) -> Iterator[Prefix]:
+    if stream.peek() != "{":
         raise GeneratorError("malformed JSON response")
-    addresses = payload.get("addresses")
-    if not addresses:
+    found = False
+    for key in stream.keys():
+        if key != "regions" or stream.peek() != "[":
+            stream.skip()
+            continue
+        for _ in stream.elements():
+            found = True
+            if stream.peek() != "{":
+                stream.skip()
+                continue
+            for region_key in stream.keys():
+                if region_key != "cidrs" or stream.peek() != "[":
+                    stream.skip()
+                    continue
+                for item in stream.items():
+                    if isinstance(item, dict) and isinstance(item.get("cidr"), str):
+                        record = _parse_ipv4_lenient(item["cidr"])
+                        if record is not None:
+                            yield record
+    stream.finish()
+    if not found:
         raise GeneratorError("empty prefixes")
-    if not isinstance(addresses, list):
+
+
+def _stream_azure_prefixes(stream: JsonStream) -> Iterator[Prefix]:
+    # Service tags are walked down to each addressPrefixes array, so even the
+    # AzureCloud tag (tens of thousands of prefixes) is never decoded whole.
+    if stream.peek() != "{":
         raise GeneratorError("malformed JSON response")
-    result: List[str] = []
-    for item in addresses:
-        if not isinstance(item, str):
-            raise GeneratorError("malformed CIDR in fastly feed")
+    found = False
+    for key in stream.keys():
+        if key != "values" or stream.peek() != "[":
+            stream.skip()
+            continue
+        for _ in stream.elements():
+            found = True
+            if stream.peek() != "{":
+                stream.skip()
+                continue
+            for value_key in stream.keys():
+                if value_key != "properties" or stream.peek() != "{":
+                    stream.skip()
+                    continue
+                for prop in stream.keys():
+                    if prop != "addressPrefixes" or stream.peek() != "[":
+                        stream.skip()
+                        continue
+                    for item in stream.items():
+                        record = _parse_ipv4_lenient(item) if isinstance(item, str) else None
+                        if record is not None:
+                            yield record
+    stream.finish()
+    if not found:
+        raise GeneratorError("empty prefixes")
+
+
+def _stream_geo_csv(lines: Iterable[str]) -> Iterator[Prefix]:
+    # RFC 8805 geofeed (DigitalOcean and others): prefix,country,region,city,postal
+    found = False
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        part = line.split(",", 1)[0].strip()
         try:
-            net = ipaddress.ip_network(item, strict=False)
+            record = _parse_ipv4(part)
         except ValueError as exc:
-            raise GeneratorError("malformed CIDR in fastly feed") from exc
-        if net.version == 4:
-            result.append(item)
-    return result
+            raise GeneratorError("malformed CIDR in geo_csv feed") from exc
+        if record is not None:
+            found = True
+            yield record
+    if not found:
+        raise GeneratorError("empty prefixes")
+
+
+FeedParser = Callable[[Iterable[bytes]], Iterable[Prefix]]
+
+
+@dataclass(frozen=True)
+class FeedFormat:
+    name: str
+    parse: FeedParser
+    cache_ext: str = "json"
+
 
+FEED_FORMATS: Dict[str, FeedFormat] = {}
 
-def _normalize_ipv4(prefixes: Iterable[str]) -> List[ipaddress.IPv4Network]:
-    networks: List[ipaddress.IPv4Network] = []
-    for pfx in prefixes:
+
+def register_feed_format(name: str, parse: FeedParser, cache_ext: str = "json") -> FeedFormat:
+    """Register a parser turning response body chunks into IPv4 prefix records.
+
+    Build parsers with _streaming_json_feed or _text_feed, which hand the
+    extractor a JsonStream or the body's lines, so no format holds its
+    whole body or decoded document in memory.
+    """
+    if name in FEED_FORMATS:
+        raise GeneratorError(f"feed format already registered: {name}")
+    feed = FeedFormat(name=name, parse=parse, cache_ext=cache_ext)
+    FEED_FORMATS[name] = feed
+    return feed
+
+
+def _streaming_json_feed(extract: Callable[[JsonStream], Iterator[Prefix]]) -> FeedParser:
+    # For large feeds: walks the document incrementally and keeps only the
+    # extracted prefixes, never the decoded document.
+    def parse(chunks: Iterable[bytes]) -> Iterator[Prefix]:
         try:
-            net = ipaddress.ip_network(pfx, strict=False)
-        except ValueError:
+            yield from extract(JsonStream(chunks))
+        except ValueError as exc:
+            raise GeneratorError("malformed JSON response") from exc
+
+    return parse
+
+
+_LINE_BREAKS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+
+
+def _iter_text_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    # Same lines as str.splitlines() on the whole decoded body; a line cut
+    # by a chunk boundary (or a "\r" that may start "\r\n") is held back.
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    tail = ""
+    for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).splitlines(keepends=True)
+        held = lines and (lines[-1][-1] not in _LINE_BREAKS or lines[-1][-1] == "\r")
+        tail = lines.pop() if held else ""
+        for line in lines:
+            yield line.rstrip(_LINE_BREAKS)
+    tail += decoder.decode(b"", final=True)
+    yield from tail.splitlines()
+
+
+def _text_feed(extract: Callable[[Iterable[str]], Iterator[Prefix]]) -> FeedParser:
+    def parse(chunks: Iterable[bytes]) -> Iterator[Prefix]:
+        return extract(_iter_text_lines(chunks))
+
+    return parse
+
+
+register_feed_format("aws_ip_ranges_json", _streaming_json_feed(_stream_aws_prefixes))
+register_feed_format("plain_cidr", _text_feed(_stream_plain_cidr), cache_ext="txt")
+register_feed_format("json_prefix_list", _streaming_json_feed(_stream_json_prefix_list))
+register_feed_format("google_cloud_json", _streaming_json_feed(_stream_google_cloud_prefixes))
+register_feed_format("fastly_public_ip_list_json", _streaming_json_feed(_stream_fastly_prefixes))
+register_feed_format("oracle_public_ip_ranges_json", _streaming_json_feed(_stream_oracle_prefixes))
+register_feed_format("azure_service_tags_json", _streaming_json_feed(_stream_azure_prefixes))
+register_feed_format("geo_csv", _text_feed(_stream_geo_csv), cache_ext="csv")
+
+
+def _dedup_sort(prefixes: Iterable[Prefix]) -> PrefixSet:
+    return prefixes if isinstance(prefixes, PrefixSet) else PrefixSet(prefixes)
+
+
+def _collapse_shadowed(prefixes: Iterable[Prefix]) -> PrefixSet:
+    return _dedup_sort(prefixes).without_shadowed()
+
+
+def _analyze_shadowed(prefixes: Iterable[Prefix]) -> tuple[int, dict[str, int]]:
+    # Same sweep as PrefixSet.without_shadowed: every shadowed block is attributed to
+    # the outermost block covering it, i.e. the shortest covering prefix.
+    shadowed = 0
+    offenders: dict[str, int] = {}
+    cover_key = ""
+    cover_end = -1
+    for prefix in prefixes if isinstance(prefixes, PrefixSet) else sorted(prefixes):
+        start, plen = prefix
+        end = start | (_IPV4_ALL_ONES >> plen)
+        if end <= cover_end:
+            shadowed += 1
+            offenders[cover_key] = offenders.get(cover_key, 0) + 1
             continue
-        if net.version == 4:
-            networks.append(net)
-    if not networks:
-        raise GeneratorError("no IPv4 prefixes after filtering")
-    return networks
+        cover_key = _format_prefix(prefix)
+        cover_end = end
+    return shadowed, offenders
 
 
-def _dedup_sort(networks: Iterable[ipaddress.IPv4Network]) -> List[ipaddress.IPv4Network]:
-    uniq = {str(net): net for net in networks}
-    return sorted(uniq.values(), key=lambda n: (int(n.network_address), n.prefixlen))
+def _aggregate(prefixes: Iterable[Prefix]) -> PrefixSet:
+    # Exact aggregation: after shadow collapse the blocks are disjoint, so in
+    # address order two siblings are always adjacent and merge on a stack.
+    starts = array("I")
+    plens = array("B")
+    for start, plen in _collapse_shadowed(prefixes):
+        starts.append(start)
+        plens.append(plen)
+        while len(plens) >= 2:
+            a, alen, b, blen = starts[-2], plens[-2], starts[-1], plens[-1]
+            size = 1 << (32 - alen)
+            if alen != blen or alen == 0 or a & size or b != a + size:
+                break
+            del starts[-1], plens[-1]
+            plens[-1] = alen - 1
+    return PrefixSet.from_sorted(zip(starts, plens))
+
+
+def _aggregate_to_budget(prefixes: Iterable[Prefix], max_entries: int) -> Tuple[PrefixSet, int]:
+    """Aggregate, then merge into covering supernets until max_entries remain.
+
+    Each candidate merge is the smallest supernet of two neighbouring entries
+    and costs the addresses it covers that no entry covered before; the
+    cheapest one is applied first. Returns the entries and the total number
+    of extra addresses covered.
+    """
+    exact = _aggregate(prefixes)
+    if len(exact) <= max_entries:
+        return exact, 0
+    nodes = list(exact)
+    remaining = len(nodes)
+    if max_entries < 1:
+        raise GeneratorError("max_entries must be >= 1")
+
+    # Doubly linked list over node indices; merged supernets are appended.
+    prev = list(range(-1, remaining - 1))
+    nxt = list(range(1, remaining + 1))
+    nxt[-1] = -1
+    alive = [True] * remaining
+
+    def span(left: int, start: int, end: int) -> Tuple[int, int, int]:
+        # Every entry inside [start, end) around `left`; they form a contiguous
+        # run because entries are disjoint and address-ordered.
+        first = last = left
+        covered = 0
+        idx = left
+        while idx != -1 and nodes[idx][0] >= start:
+            first = idx
+            covered += 1 << (32 - nodes[idx][1])
+            idx = prev[idx]
+        idx = nxt[left]
+        while idx != -1 and nodes[idx][0] < end:
+            last = idx
+            covered += 1 << (32 - nodes[idx][1])
+            idx = nxt[idx]
+        return first, last, covered
+
+    def candidate(left: int, right: int) -> Tuple[int, int, int, int, int]:
+        (a, alen), (b, _) = nodes[left], nodes[right]
+        plen = min(alen, 32 - (a ^ b).bit_length())
+        start = a & (_IPV4_ALL_ONES ^ (_IPV4_ALL_ONES >> plen))
+        size = 1 << (32 - plen)
+        _, _, covered = span(left, start, start + size)
+        return size - covered, start, plen, left, right
+
+    def insert(first: int, last: int, prefix: Prefix) -> int:
+        nonlocal remaining
+        idx = first
+        while True:
+            alive[idx] = False
+            remaining -= 1
+            if idx == last:
+                break
+            idx = nxt[idx]
+        new = len(nodes)
+        nodes.append(prefix)
+        alive.append(True)
+        prev.append(prev[first])
+        nxt.append(nxt[last])
+        if prev[first] != -1:
+            nxt[prev[first]] = new
+        if nxt[last] != -1:
+            prev[nxt[last]] = new
+        remaining += 1
+        return new
+
+    heap = [candidate(idx, idx + 1) for idx in range(remaining - 1)]
+    heapq.heapify(heap)
+    overcovered = 0
+    while remaining > max_entries and heap:
+        extra, start, plen, left, right = heapq.heappop(heap)
+        if not (alive[left] and alive[right] and nxt[left] == right):
+            continue
+        fresh = candidate(left, right)
+        if fresh[0] != extra:
+            heapq.heappush(heap, fresh)
+            continue
+        first, last, _ = span(left, start, start + (1 << (32 - plen)))
+        new = insert(first, last, (start, plen))
+        overcovered += extra
+        # A merged block may complete a sibling pair; those merges are free.
+        while plen > 0:
+            size = 1 << (32 - plen)
+            if start & size:
+                left = prev[new]
+                if left == -1 or nodes[left] != (start - size, plen):
+                    break
+                start -= size
+                new = insert(left, new, (start, plen - 1))
+            else:
+                right = nxt[new]
+                if right == -1 or nodes[right] != (start + size, plen):
+                    break
+                new = insert(new, right, (start, plen - 1))
+            plen -= 1
+        for left, right in ((prev[new], new), (new, nxt[new])):
+            if left != -1 and right != -1:
+                heapq.heappush(heap, candidate(left, right))
+
+    return PrefixSet(prefix for idx, prefix in enumerate(nodes) if alive[idx]), overcovered
+
+
+def _to_prefixes(networks: Iterable[ipaddress.IPv4Network]) -> List[Prefix]:
+    return [(int(net.network_address), net.prefixlen) for net in networks]
 
 
 def collapse_shadowed(networks: List[ipaddress.IPv4Network]) -> List[ipaddress.IPv4Network]:
-    accepted: List[ipaddress.IPv4Network] = []
-    accepted_set: set[ipaddress.IPv4Network] = set()
-    for net in sorted(networks, key=lambda n: (n.prefixlen, int(n.network_address))):
-        shadowed = False
-        for plen in range(net.prefixlen - 1, -1, -1):
-            if net.supernet(new_prefix=plen) in accepted_set:
-                shadowed = True
-                break
-        if not shadowed:
-            accepted.append(net)
-            accepted_set.add(net)
-    return sorted(accepted, key=lambda n: (int(n.network_address), n.prefixlen))
+    # Repeated inputs are kept as repeated outputs, as before PrefixSet.
+    prefixes = _to_prefixes(networks)
+    kept = _collapse_shadowed(prefixes)
+    return [ipaddress.IPv4Network(prefix) for prefix in sorted(prefixes) if prefix in kept]
 
 
 def analyze_shadowed_prefixes(
     networks: Iterable[ipaddress.IPv4Network],
 ) -> tuple[int, dict[str, int]]:
-    nets = list(networks)
-    nets_sorted = sorted(nets, key=lambda n: (n.prefixlen, int(n.network_address)))
-    shadowed = 0
-    offenders: dict[str, int] = {}
-    for idx, net in enumerate(nets_sorted):
-        for supernet in nets_sorted[:idx]:
-            if net.subnet_of(supernet):
-                shadowed += 1
-                key = str(supernet)
-                offenders[key] = offenders.get(key, 0) + 1
-                break
-    return shadowed, offenders
+    return _analyze_shadowed(_to_prefixes(networks))
+
+
+@dataclass(frozen=True)
+class AsnCachePolicy:
+    """On-disk RIPEstat cache settings; same meaning as for URL resources."""
+
+    base_dir: Path
+    allow_cache: bool = False
+    allow_stale_cache: bool = False
+    # With allow_cache, reuse a cached answer without asking RIPEstat while its
+    # query time is younger than this many seconds.
+    ttl: float = 0.0
+
+
+def _asn_cache_paths(base_dir: Path, asn: str) -> tuple[Path, Path]:
+    cache_dir = base_dir / "cache" / "asn"
+    return cache_dir / f"{asn}.json", cache_dir / f"{asn}.etag"
+
+
+def _ripestat_query_time(payload: object) -> Optional[datetime]:
+    if not isinstance(payload, dict):
+        return None
+    data = payload.get("data")
+    value = None
+    if isinstance(data, dict):
+        value = data.get("query_time") or data.get("query_endtime")
+    value = value or payload.get("time")
+    try:
+        when = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return when if when.tzinfo else when.replace(tzinfo=timezone.utc)
+
+
+def _load_asn_cache(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (OSError, json.JSONDecodeError) as exc:
+        raise GeneratorError(f"malformed cached RIPEstat response {path}") from exc
+
+
+def fetch_prefixes_for_asn(
+    asn: str,
+    client: Optional[HttpClient] = None,
+    deadline: Optional[float] = None,
+    cache: Optional[AsnCachePolicy] = None,
+    result: Optional[ResourceResult] = None,
+) -> List[Prefix]:
+    if client is None:
+        with HttpClient() as own_client:
+            return fetch_prefixes_for_asn(asn, own_client, deadline, cache, result)
+    if cache is None:
+        payload = _fetch_json(client, RIPESTAT_URL, params={"resource": asn}, deadline=deadline)
+        return _extract_prefixes(payload)
+
+    url = f"{RIPESTAT_URL}?resource={asn}"
+    data_path, etag_path = _asn_cache_paths(cache.base_dir, asn)
+    if cache.allow_cache and cache.ttl > 0 and data_path.exists():
+        fetched = _ripestat_query_time(_load_asn_cache(data_path))
+        if fetched is not None:
+            age = (datetime.now(timezone.utc) - fetched).total_seconds()
+            if age < cache.ttl:
+                return _extract_prefixes(_load_asn_cache(data_path))
+
+    # A 304 is only usable when the cached answer may be; otherwise ask for
+    # the full response rather than turn "not modified" into an error.
+    headers = {}
+    if cache.allow_cache and data_path.exists() and etag_path.exists():
+        headers["If-None-Match"] = etag_path.read_text().strip()
+    try:
+        resp = _request_with_retries(
+            client, RIPESTAT_URL, params={"resource": asn}, headers=headers, deadline=deadline
+        )
+    except GeneratorError:
+        if cache.allow_stale_cache and data_path.exists():
+            _mark_stale_cache_used(result, "timeout", url)
+            return _extract_prefixes(_load_asn_cache(data_path))
+        raise
 
+    if resp.status_code == 304:
+        if cache.allow_cache and data_path.exists():
+            return _extract_prefixes(_load_asn_cache(data_path))
+        raise GeneratorError("304 received but cache is missing or disallowed")
+
+    if resp.status_code != 200:
+        if cache.allow_stale_cache and data_path.exists():
+            _mark_stale_cache_used(result, "non_200", url, resp.status_code)
+            return _extract_prefixes(_load_asn_cache(data_path))
+        raise GeneratorError(f"non-200 from {RIPESTAT_URL}: {resp.status_code}")
 
-def fetch_prefixes_for_asn(asn: str) -> List[str]:
-    payload = _fetch_json(RIPESTAT_URL, params={"resource": asn})
-    return _extract_prefixes(payload)
+    try:
+        payload = resp.json()
+    except json.JSONDecodeError as exc:
+        raise GeneratorError("malformed JSON response") from exc
+    # RIPEstat reports its own failures (maintenance, backend errors) in-band.
+    status = payload.get("status", "ok") if isinstance(payload, dict) else "ok"
+    if status != "ok":
+        if cache.allow_stale_cache and data_path.exists():
+            _mark_stale_cache_used(result, "status", url)
+            return _extract_prefixes(_load_asn_cache(data_path))
+        raise GeneratorError(f"RIPEstat status {status} for {asn}")
+
+    prefixes = _extract_prefixes(payload)
+    _write_cache(data_path, resp.text)
+    if resp.headers.get("ETag"):
+        _write_cache(etag_path, resp.headers["ETag"])
+    else:
+        etag_path.unlink(missing_ok=True)
+    return prefixes
+
+
+class AsnLookup:
+    """Run-wide RIPEstat lookups, shared by every resource of one run.
+
+    announced-prefixes answers one resource per call and does not say which
+    origin a prefix belongs to, so the fewest possible calls is one per
+    distinct ASN per run. Callers asking for an ASN that is already in flight
+    wait for that request. A failed lookup is not remembered: callers that
+    were waiting on it (and later ones) fall back to their own request.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._done: Dict[str, Tuple[PrefixSet, bool]] = {}
+        self._pending: Dict[str, Future] = {}
+
+    def fetch(
+        self,
+        asn: str,
+        client: HttpClient,
+        deadline: Optional[float] = None,
+        cache: Optional[AsnCachePolicy] = None,
+        result: Optional[ResourceResult] = None,
+    ) -> PrefixSet:
+        with self._lock:
+            done = self._done.get(asn)
+            waiter = self._pending.get(asn) if done is None else None
+            owner = done is None and waiter is None
+            if owner:
+                waiter = self._pending[asn] = Future()
+        if done is None and not owner:
+            try:
+                done = waiter.result()
+            except GeneratorError:
+                return PrefixSet(fetch_prefixes_for_asn(asn, client, deadline, cache, result))
+        if done is not None:
+            prefixes, stale = done
+            if stale and result is not None:
+                result.stale_cache_used = True
+            return prefixes
+
+        # The shared answer records whether it came from the stale cache, so
+        # every resource that uses it reports stale_cache_used.
+        scratch = ResourceResult(resource_id=asn)
+        try:
+            prefixes = PrefixSet(fetch_prefixes_for_asn(asn, client, deadline, cache, scratch))
+        except BaseException as exc:
+            with self._lock:
+                del self._pending[asn]
+            waiter.set_exception(exc)
+            raise
+        done = (prefixes, scratch.stale_cache_used)
+        with self._lock:
+            self._done[asn] = done
+            del self._pending[asn]
+        waiter.set_result(done)
+        if scratch.stale_cache_used and result is not None:
+            result.stale_cache_used = True
+        return prefixes
+
+
+def _fetch_attributed(
+    asn: str,
+    client: HttpClient,
+    deadline: Optional[float],
+    cache: Optional[AsnCachePolicy],
+    result: Optional[ResourceResult],
+    lookup: Optional[AsnLookup],
+) -> PrefixSet:
+    try:
+        if lookup is not None:
+            return lookup.fetch(asn, client, deadline, cache, result)
+        return PrefixSet(fetch_prefixes_for_asn(asn, client, deadline, cache, result))
+    except GeneratorError as exc:
+        raise GeneratorError(f"{asn}: {exc}") from exc
+
+
+def fetch_prefixes_by_asn(
+    asns: List[str],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    client: Optional[HttpClient] = None,
+    deadline: Optional[float] = None,
+    cache: Optional[AsnCachePolicy] = None,
+    result: Optional[ResourceResult] = None,
+    lookup: Optional[AsnLookup] = None,
+) -> Dict[str, PrefixSet]:
+    """Prefixes per distinct ASN, in config order; errors name the failing ASN."""
+    if max_concurrency < 1:
+        raise GeneratorError("max_concurrency must be >= 1")
+    if client is None:
+        with HttpClient() as own_client:
+            return fetch_prefixes_by_asn(
+                asns, max_concurrency, own_client, deadline, cache, result, lookup
+            )
+
+    unique = list(dict.fromkeys(asns))
+    by_asn: Dict[str, PrefixSet] = {}
+    if max_concurrency == 1 or len(unique) == 1:
+        for asn in unique:
+            by_asn[asn] = _fetch_attributed(asn, client, deadline, cache, result, lookup)
+        return by_asn
+
+    # Results are merged in config order, so the first failing ASN (in that
+    # order) aborts the resource and the output does not depend on timing.
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(unique))) as pool:
+        futures = [
+            pool.submit(_fetch_attributed, asn, client, deadline, cache, result, lookup)
+            for asn in unique
+        ]
+        try:
+            for asn, future in zip(unique, futures):
+                by_asn[asn] = future.result()
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+    return by_asn
+
+
+def fetch_prefixes_for_asns(
+    asns: List[str],
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    client: Optional[HttpClient] = None,
+    deadline: Optional[float] = None,
+    cache: Optional[AsnCachePolicy] = None,
+    result: Optional[ResourceResult] = None,
+    lookup: Optional[AsnLookup] = None,
+) -> PrefixSet:
+    by_asn = fetch_prefixes_by_asn(
+        asns, max_concurrency, client, deadline, cache, result, lookup
+    )
+    return PrefixSet().union(*by_asn.values())
 
 
 def _cache_paths(base_dir: Path, resource: ResourceConfig) -> tuple[Path, Path]:
     cache_dir = base_dir / "cache"
-    ext = "txt" if resource.format == "plain_cidr" else "json"
+    feed = FEED_FORMATS.get(resource.format or "")
+    ext = feed.cache_ext if feed else "json"
     data_path = cache_dir / f"{resource.resource_id}.{ext}"
     etag_path = cache_dir / f"{resource.resource_id}.etag"
     return data_path, etag_path
 
 
 def _write_cache(path: Path, contents: str) -> None:
+    # Atomic, and with a tmp name of its own: parallel resources may write
+    # the same entry (e.g. a shared ASN) at the same time.
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(contents)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as fh:
+            fh.write(contents)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def _iter_file_chunks(path: Path) -> Iterator[bytes]:
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _parsed_cache(data_path: Path) -> ParsedPrefixCache:
+    return ParsedPrefixCache(data_path.parent / "parsed", PARSED_CACHE_MAX_BYTES)
+
+
+def _body_key(feed: FeedFormat, body_sha256: str) -> str:
+    return hashlib.sha256(f"{feed.name}:{body_sha256}".encode()).hexdigest()
+
+
+def _parse_body(feed: FeedFormat, path: Path, key: str) -> PrefixSet:
+    # A body seen before (304, unchanged 200, stale fallback) skips parsing.
+    # Entries are stored deduplicated and sorted, i.e. exactly as a PrefixSet.
+    cache = _parsed_cache(path)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    prefixes = PrefixSet(feed.parse(_iter_file_chunks(path)))
+    cache.put(key, prefixes)
+    return prefixes
+
+
+def _parse_cached(feed: FeedFormat, path: Path) -> PrefixSet:
+    digest = hashlib.sha256()
+    for chunk in _iter_file_chunks(path):
+        digest.update(chunk)
+    return _parse_body(feed, path, _body_key(feed, digest.hexdigest()))
+
+
+def _parse_response(feed: FeedFormat, resp: requests.Response, data_path: Path) -> PrefixSet:
+    # The body is hashed into a tmp cache file first, so an unchanged body is
+    # never parsed; the cache is replaced only once the body parsed cleanly.
+    tmp_path = data_path.with_name(data_path.name + ".tmp")
+    tmp_path.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    try:
+        with resp, open(tmp_path, "wb") as fh:
+            for chunk in resp.iter_content(STREAM_CHUNK_SIZE):
+                digest.update(chunk)
+                fh.write(chunk)
+        prefixes = _parse_body(feed, tmp_path, _body_key(feed, digest.hexdigest()))
+        os.replace(tmp_path, data_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return prefixes
 
 
 def fetch_prefixes_for_url(
-    resource: ResourceConfig, base_dir: Path, allow_cache: bool, allow_stale_cache: bool
-) -> List[str]:
+    resource: ResourceConfig,
+    base_dir: Path,
+    allow_cache: bool,
+    allow_stale_cache: bool,
+    result: Optional[ResourceResult] = None,
+    client: Optional[HttpClient] = None,
+    deadline: Optional[float] = None,
+) -> PrefixSet:
     if not resource.url or not resource.format:
         raise GeneratorError("invalid url resource configuration")
+    feed = FEED_FORMATS.get(resource.format)
+    if feed is None:
+        raise GeneratorError("unsupported url format")
+    if client is None:
+        with HttpClient() as own_client:
+            return fetch_prefixes_for_url(
+                resource, base_dir, allow_cache, allow_stale_cache, result, own_client, deadline
+            )
+
+    data_path, etag_path = _cache_paths(base_dir, resource)
+    headers = {}
+    if etag_path.exists():
+        headers["If-None-Match"] = etag_path.read_text().strip()
+    try:
+        resp = _request_with_retries(
+            client, resource.url, headers=headers, deadline=deadline, stream=True
+        )
+    except GeneratorError as exc:
+        if allow_stale_cache and data_path.exists():
+            _mark_stale_cache_used(result, "timeout", resource.url)
+            return _parse_cached(feed, data_path)
+        raise exc
+
+    if resp.status_code == 304:
+        resp.close()
+        if allow_cache and data_path.exists():
+            return _parse_cached(feed, data_path)
+        raise GeneratorError("304 received but cache is missing or disallowed")
+
+    if resp.status_code != 200:
+        resp.close()
+        if allow_stale_cache and data_path.exists():
+            _mark_stale_cache_used(result, "non_200", resource.url, resp.status_code)
+            return _parse_cached(feed, data_path)
+        raise GeneratorError(f"non-200 from {resource.url}: {resp.status_code}")
+
+    try:
+        prefixes = _parse_response(feed, resp, data_path)
+    except requests.exceptions.RequestException as exc:
+        # The connection broke mid-body: same as a timeout before the headers.
+        if allow_stale_cache and data_path.exists():
+            _mark_stale_cache_used(result, "timeout", resource.url)
+            return _parse_cached(feed, data_path)
+        raise GeneratorError(f"request failed for {resource.url}") from exc
+    if resp.headers.get("ETag"):
+        _write_cache(etag_path, resp.headers["ETag"])
+    return prefixes
+
+
+def _prefix_digest(networks: Iterable[Prefix]) -> str:
+    """sha256 over the published prefixes, one "a.b.c.d/n" per line in file order."""
+    digest = hashlib.sha256()
+    for net in networks:
+        digest.update(f"{_format_prefix(net)}\n".encode("ascii"))
+    return digest.hexdigest()
 
-    if resource.format == "aws_ip_ranges_json":
-        data_path, etag_path = _cache_paths(base_dir, resource)
-        headers = {}
-        if etag_path.exists():
-            headers["If-None-Match"] = etag_path.read_text().strip()
-        try:
-            resp = _request_with_retries(resource.url, headers=headers)
-        except GeneratorError as exc:
-            if allow_stale_cache and data_path.exists():
-                _mark_stale_cache_used("timeout", resource.url)
-                payload = json.loads(data_path.read_text())
-                return _extract_aws_prefixes(payload)
-            raise exc
-
-        if resp.status_code == 304:
-            if allow_cache and data_path.exists():
-                payload = json.loads(data_path.read_text())
-                return _extract_aws_prefixes(payload)
-            raise GeneratorError("304 received but cache is missing or disallowed")
-
-        if resp.status_code != 200:
-            if allow_stale_cache and data_path.exists():
-                _mark_stale_cache_used("non_200", resource.url, resp.status_code)
-                payload = json.loads(data_path.read_text())
-                return _extract_aws_prefixes(payload)
-            raise GeneratorError(f"non-200 from {resource.url}: {resp.status_code}")
-        try:
-            payload = resp.json()
-        except json.JSONDecodeError as exc:
-            raise GeneratorError("malformed JSON response") from exc
-        _write_cache(data_path, resp.text)
-        if resp.headers.get("ETag"):
-            _write_cache(etag_path, resp.headers["ETag"])
-        return _extract_aws_prefixes(payload)
-    if resource.format == "plain_cidr":
-        data_path, etag_path = _cache_paths(base_dir, resource)
-        headers = {}
-        if etag_path.exists():
-            headers["If-None-Match"] = etag_path.read_text().strip()
-        try:
-            resp = _request_with_retries(resource.url, headers=headers)
-        except GeneratorError as exc:
-            if allow_stale_cache and data_path.exists():
-                _mark_stale_cache_used("timeout", resource.url)
-                return _extract_plain_cidr(data_path.read_text())
-            raise exc
-        if resp.status_code == 304:
-            if allow_cache and data_path.exists():
-                return _extract_plain_cidr(data_path.read_text())
-            raise GeneratorError("304 received but cache is missing or disallowed")
-        if resp.status_code != 200:
-            if allow_stale_cache and data_path.exists():
-                _mark_stale_cache_used("non_200", resource.url, resp.status_code)
-                return _extract_plain_cidr(data_path.read_text())
-            raise GeneratorError(f"non-200 from {resource.url}: {resp.status_code}")
-        text = resp.text
-        _write_cache(data_path, text)
-        if resp.headers.get("ETag"):
-            _write_cache(etag_path, resp.headers["ETag"])
-        return _extract_plain_cidr(text)
-    if resource.format == "json_prefix_list":
-        data_path, etag_path = _cache_paths(base_dir, resource)
-        headers = {}
-        if etag_path.exists():
-            headers["If-None-Match"] = etag_path.read_text().strip()
-        try:
-            resp = _request_with_retries(resource.url, headers=headers)
-        except GeneratorError as exc:
-            if allow_stale_cache and data_path.exists():
-                _mark_stale_cache_used("timeout", resource.url)
-                payload = json.loads(data_path.read_text())
-                return _extract_json_prefix_list(payload)
-            raise exc
-        if resp.status_code == 304:
-            if allow_cache and data_path.exists():
-                payload = json.loads(data_path.read_text())
-                return _extract_json_prefix_list(payload)
-            raise GeneratorError("304 received but cache is missing or disallowed")
-        if resp.status_code != 200:
-            if allow_stale_cache and data_path.exists():
-                _mark_stale_cache_used("non_200", resource.url, resp.status_code)
-                payload = json.loads(data_path.read_text())
-                return _extract_json_prefix_list(payload)
-            raise GeneratorError(f"non-200 from {resource.url}: {resp.status_code}")
-        try:
-            payload = resp.json()
-        except json.JSONDecodeError as exc:
-            raise GeneratorError("malformed JSON response") from exc
-        _write_cache(data_path, resp.text)
-        if resp.headers.get("ETag"):
-            _write_cache(etag_path, resp.headers["ETag"])
-        return _extract_json_prefix_list(payload)
-    if resource.format == "google_cloud_json":
-        data_path, etag_path = _cache_paths(base_dir, resource)
-        headers = {}
-        if etag_path.exists():
-            headers["If-None-Match"] = etag_path.read_text().strip()
-        try:
-            resp = _request_with_retries(resource.url, headers=headers)
-        except GeneratorError as exc:
-            if allow_stale_cache and data_path.exists():
-                _mark_stale_cache_used("timeout", resource.url)
-                payload = json.loads(data_path.read_text())
-                return _extract_google_cloud_prefixes(payload)
-            raise exc
-        if resp.status_code == 304:
-            if allow_cache and data_path.exists():
-                payload = json.loads(data_path.read_text())
-                return _extract_google_cloud_prefixes(payload)
-            raise GeneratorError("304 received but cache is missing or disallowed")
-        if resp.status_code != 200:
-            if allow_stale_cache and data_path.exists():
-                _mark_stale_cache_used("non_200", resource.url, resp.status_code)
-                payload = json.loads(data_path.read_text())
-                return _extract_google_cloud_prefixes(payload)
-            raise GeneratorError(f"non-200 from {resource.url}: {resp.status_code}")
-        try:
-            payload = resp.json()
-        except json.JSONDecodeError as exc:
-            raise GeneratorError("malformed JSON response") from exc
-        _write_cache(data_path, resp.text)
-        if resp.headers.get("ETag"):
-            _write_cache(etag_path, resp.headers["ETag"])
-        return _extract_google_cloud_prefixes(payload)
-    if resource.format == "fastly_public_ip_list_json":
-        data_path, etag_path = _cache_paths(base_dir, resource)
-        headers = {}
-        if etag_path.exists():
-            headers["If-None-Match"] = etag_path.read_text().strip()
-        try:
-            resp = _request_with_retries(resource.url, headers=headers)
-        except GeneratorError as exc:
-            if allow_stale_cache and data_path.exists():
-                _mark_stale_cache_used("timeout", resource.url)
-                payload = json.loads(data_path.read_text())
-                return _extract_fastly_prefixes(payload)
-            raise exc
-        if resp.status_code == 304:
-            if allow_cache and data_path.exists():
-                payload = json.loads(data_path.read_text())
-                return _extract_fastly_prefixes(payload)
-            raise GeneratorError("304 received but cache is missing or disallowed")
-        if resp.status_code != 200:
-            if allow_stale_cache and data_path.exists():
-                _mark_stale_cache_used("non_200", resource.url, resp.status_code)
-                payload = json.loads(data_path.read_text())
-                return _extract_fastly_prefixes(payload)
-            raise GeneratorError(f"non-200 from {resource.url}: {resp.status_code}")
-        try:
-            payload = resp.json()
-        except json.JSONDecodeError as exc:
-            raise GeneratorError("malformed JSON response") from exc
-        _write_cache(data_path, resp.text)
-        if resp.headers.get("ETag"):
-            _write_cache(etag_path, resp.headers["ETag"])
-        return _extract_fastly_prefixes(payload)
 
-    raise GeneratorError("unsupported url format")
+_RSC_MENU = "/ip/firewall/address-list"
+_RSC_ADD = f"{_RSC_MENU} add list=$AddressList address="
+_RSC_COMPACT_ADD = "add list=$AddressList address="
 
 
-def _render_rsc(resource: ResourceConfig, networks: List[ipaddress.IPv4Network]) -> str:
+def _rsc_add_lines(entries: Iterable[Tuple[Prefix, str]], style: str) -> Iterator[str]:
+    if style == "compact":
+        yield _RSC_MENU
+        for net, resource_id in entries:
+            yield f"{_RSC_COMPACT_ADD}{_routeros_address(net)} comment=\"iplist:auto:{resource_id}\""
+    else:
+        for net, resource_id in entries:
+            yield f"{_RSC_ADD}{_format_prefix(net)} comment=\"iplist:auto:{resource_id}\""
+
+
+def _render_rsc(
+    resource: ResourceConfig, networks: PrefixSet, digest: str, style: str = "full"
+) -> Iterator[str]:
+    """Lines of dist/<resource>.rsc without line endings, produced lazily."""
+    yield "# iplist-rsc v1"
+    yield f"# resource={resource.resource_id}"
+    yield f"# generated={_iso_utc_now()}"
+    yield f"# count={len(networks)}"
+    yield f"# sha256={digest}"
+    yield ""
+    yield ":global AddressList"
+    resource_id = resource.resource_id
+    yield from _rsc_add_lines(((net, resource_id) for net in networks), style)
+
+
+def _rsc_command(line: str, in_menu: bool) -> Optional[str]:
+    """The address-list command ("add ...", "remove ...") a .rsc line runs, if any.
+
+    Full lines carry the menu path; compact ones follow a bare menu line.
+    """
+    if line.startswith(_RSC_MENU + " "):
+        return line[len(_RSC_MENU) + 1 :]
+    if in_menu and line and not line.startswith(("/", ":", "#")):
+        return line
+    return None
+
+
+def _rsc_in_menu(line: str, in_menu: bool) -> bool:
+    # Only a path on its own changes the current menu; "/menu cmd" does not.
+    if line == _RSC_MENU:
+        return True
+    return in_menu and not (line.startswith("/") and " " not in line)
+
+
+class _RscCheck:
+    """Self-check of a dist .rsc, fed one line at a time while it is written."""
+
+    def __init__(self, resource_ids: Set[str]) -> None:
+        self.resource_ids = resource_ids
+        self.has_address_list = False
+        self.expected_count: Optional[str] = None
+        self.add_count = 0
+        self.in_menu = False
+
+    def feed(self, line: str) -> None:
+        if "\r" in line or "\n" in line:
+            raise GeneratorError("self-check failed: line break inside a line")
+        command = _rsc_command(line, self.in_menu)
+        self.in_menu = _rsc_in_menu(line, self.in_menu)
+        if command is not None and command.startswith("add "):
+            if "list=$AddressList" not in line:
+                raise GeneratorError("self-check failed: add line missing $AddressList")
+            match = _RSC_TAG_RE.search(line)
+            if match is None or match.group(1) not in self.resource_ids:
+                raise GeneratorError("self-check failed: add line missing comment tag")
+            self.add_count += 1
+        elif line == ":global AddressList":
+            self.has_address_list = True
+        elif line.startswith("# count=") and self.expected_count is None:
+            self.expected_count = line.split("=", 1)[1].strip()
+        elif "/ip/firewall/address-list remove" in line or (command or "").startswith("remove"):
+            raise GeneratorError("self-check failed: remove line present")
+
+    def finish(self) -> None:
+        if not self.has_address_list:
+            raise GeneratorError("self-check failed: AddressList missing")
+        if self.expected_count is None:
+            raise GeneratorError("self-check failed: count header missing")
+        try:
+            expected_count = int(self.expected_count)
+        except ValueError as exc:
+            raise GeneratorError("self-check failed: count header invalid") from exc
+        if self.add_count < 1:
+            raise GeneratorError("self-check failed: add_count < 1")
+        if self.add_count != expected_count:
+            raise GeneratorError("self-check failed: count header mismatch")
+
+
+def _write_checked_rsc(path: Path, lines: Iterable[str], resource_ids: Set[str]) -> None:
+    _write_checked_lines(path, lines, _RscCheck(resource_ids))
+
+
+def _write_checked_lines(
+    path: Path, lines: Iterable[str], check: Union[_RscCheck, _DeltaCheck]
+) -> None:
+    # One pass: every line is checked as it is written, so neither the file
+    # nor its text ever has to be held in memory or read back.
+    with open(path, "w", encoding="utf-8", newline="\n") as fh:
+        for line in lines:
+            check.feed(line)
+            fh.write(line)
+            fh.write("\n")
+    check.finish()
+
+
+def _write_dist_formats(
+    tmp_paths: Dict[str, Path], resource: ResourceConfig, networks: PrefixSet, digest: str
+) -> None:
+    """Write every requested DIST_FORMATS file in one pass over the set."""
+    name = f"iplist_{resource.resource_id}"
+    with ExitStack() as stack:
+        out = {
+            fmt: stack.enter_context(
+                open(path, "wb")
+                if fmt == "bin"
+                else open(path, "w", encoding="ascii", newline="\n")
+            )
+            for fmt, path in tmp_paths.items()
+        }
+        txt, nft, ipset, binary = (out.get(fmt) for fmt in ("txt", "nft", "ipset", "bin"))
+        if nft is not None:
+            nft.write(
+                f"# iplist resource={resource.resource_id} count={len(networks)} sha256={digest}\n"
+                f"define {name} = {{"
+            )
+        if ipset is not None:
+            maxelem = max(_IPSET_MIN_MAXELEM, len(networks) + 1)
+            ipset.write(f"create {name} hash:net family inet maxelem {maxelem} -exist\n")
+        if binary is not None:
+            binary.write(
+                _BIN_HEADER.pack(_BIN_MAGIC, _BIN_VERSION, len(networks), bytes.fromhex(digest))
+            )
+
+        separator = "\n"
+        for prefix in networks:
+            cidr = _format_prefix(prefix)
+            if txt is not None:
+                txt.write(f"{cidr}\n")
+            if nft is not None:
+                nft.write(f"{separator}  {cidr}")
+                separator = ",\n"
+            if ipset is not None:
+                if prefix[1] == 0:
+                    ipset.write(f"add {name} 0.0.0.0/1 -exist\nadd {name} 128.0.0.0/1 -exist\n")
+                else:
+                    ipset.write(f"add {name} {cidr} -exist\n")
+            if binary is not None:
+                binary.write(_BIN_RECORD.pack(*prefix))
+
+        if nft is not None:
+            nft.write("\n}\n")
+
+
+def _render_part_rsc(
+    dist_id: str,
+    digest: str,
+    index: int,
+    parts: int,
+    count: int,
+    entries: Iterable[Tuple[Prefix, str]],
+    style: str,
+) -> Iterator[str]:
+    yield "# iplist-rsc-part v1"
+    yield f"# resource={dist_id}"
+    yield f"# part={index}/{parts}"
+    yield f"# sha256={digest}"
+    yield f"# count={count}"
+    yield ""
+    yield ":global AddressList"
+    yield from _rsc_add_lines(entries, style)
+
+
+def _render_manifest(dist_id: str, digest: str, count: int, parts: int, chunk_entries: int) -> str:
     header = [
-        "# iplist-rsc v1",
-        f"# resource={resource.resource_id}",
+        "# iplist-manifest v1",
+        f"# resource={dist_id}",
         f"# generated={_iso_utc_now()}",
-        f"# count={len(networks)}",
-        "",
+        f"# sha256={digest}",
+        f"# count={count}",
+        f"# chunk_entries={chunk_entries}",
+        f"# max_bytes={MAX_PART_BYTES}",
+        f"# parts={parts}",
     ]
-    lines = [":global AddressList"]
-    for net in networks:
-        lines.append(
-            f"/ip/firewall/address-list add list=$AddressList address={net} "
-            f"comment=\"iplist:auto:{resource.resource_id}\""
+    return "\n".join(header) + "\n"
+
+
+def _manifest_path(dist_dir: Path, dist_id: str) -> Path:
+    return dist_dir / f"{dist_id}.manifest.rsc"
+
+
+def _chunk_files(dist_dir: Path, dist_id: str) -> List[Path]:
+    return sorted(dist_dir.glob(f"{dist_id}.part[0-9][0-9].rsc"))
+
+
+def _chunks_current(dist_dir: Path, dist_id: str, digest: str, chunk_entries: Optional[int]) -> bool:
+    if chunk_entries is None:
+        return True
+    try:
+        lines = _manifest_path(dist_dir, dist_id).read_text(encoding="utf-8").splitlines()
+    except (OSError, UnicodeDecodeError):
+        return False
+    return (
+        _rsc_header(lines, "sha256") == digest
+        and _rsc_header(lines, "chunk_entries") == str(chunk_entries)
+        and _rsc_header(lines, "max_bytes") == str(MAX_PART_BYTES)
+    )
+
+
+def _plan_chunks(
+    dist_id: str,
+    entries: Iterable[Tuple[Prefix, str]],
+    count: int,
+    digest: str,
+    style: str,
+    chunk_entries: int,
+) -> List[int]:
+    """Entry count of each part: at most chunk_entries entries and MAX_PART_BYTES bytes.
+
+    A list that would need more than MAX_CHUNK_PARTS parts gets none (an
+    empty plan): only its full .rsc is published and loaders fall back to it.
+    """
+    # Header and preamble at their widest (part=99/99, the whole list's count).
+    header = sum(
+        len(line) + 1
+        for line in _render_part_rsc(
+            dist_id, digest, MAX_CHUNK_PARTS, MAX_CHUNK_PARTS, count, (), style
+        )
+    )
+    sizes: List[int] = []
+    size, used = 0, header
+    for line in _rsc_add_lines(entries, style):
+        if line == _RSC_MENU:
+            continue
+        cost = len(line) + 1
+        if size and (size == chunk_entries or used + cost > MAX_PART_BYTES):
+            sizes.append(size)
+            size, used = 0, header
+        size += 1
+        used += cost
+    sizes.append(size)
+    if len(sizes) > MAX_CHUNK_PARTS:
+        print(
+            f"event=chunks_skipped resource={dist_id} count={count} parts={len(sizes)} "
+            f"max_parts={MAX_CHUNK_PARTS}",
+            flush=True,
         )
-    return "\n".join(header + lines) + "\n"
+        return []
+    return sizes
+
+
+def _write_chunks(
+    dist_dir: Path,
+    dist_id: str,
+    entries: Iterable[Tuple[Prefix, str]],
+    count: int,
+    sizes: List[int],
+    digest: str,
+    style: str,
+    chunk_entries: int,
+    resource_ids: Set[str],
+) -> List[Tuple[Path, Path]]:
+    """Write part and manifest tmp files as planned by _plan_chunks.
+
+    Returns (tmp, final) pairs, manifest last. An empty plan still gets a
+    manifest, with parts=0, so an unchanged list is not replanned each run.
+    """
+    parts = len(sizes)
+    staged: List[Tuple[Path, Path]] = []
+    remaining = iter(entries)
+    for index, size in enumerate(sizes, start=1):
+        final_path = dist_dir / f"{dist_id}.part{index:02d}.rsc"
+        tmp_path = final_path.with_name(final_path.name + ".tmp")
+        staged.append((tmp_path, final_path))
+        lines = _render_part_rsc(dist_id, digest, index, parts, size, islice(remaining, size), style)
+        _write_checked_rsc(tmp_path, lines, resource_ids)
+
+    final_path = _manifest_path(dist_dir, dist_id)
+    tmp_path = final_path.with_name(final_path.name + ".tmp")
+    staged.append((tmp_path, final_path))
+    with open(tmp_path, "w", encoding="utf-8", newline="\n") as fh:
+        fh.write(_render_manifest(dist_id, digest, count, parts, chunk_entries))
+    return staged
+
+
+def _publish_chunks(dist_dir: Path, dist_id: str, staged: List[Tuple[Path, Path]]) -> None:
+    # Parts go first so a published manifest never names a missing part; parts
+    # left over from a longer list (or from chunking being turned off) go away.
+    keep = {final for _, final in staged}
+    for tmp_path, final_path in staged:
+        os.replace(tmp_path, final_path)
+    for path in _chunk_files(dist_dir, dist_id) + [_manifest_path(dist_dir, dist_id)]:
+        if path not in keep:
+            path.unlink(missing_ok=True)
+
+
+def _routeros_address(prefix: Prefix) -> str:
+    # RouterOS stores host entries without "/32", so find must match that form.
+    text = _format_prefix(prefix)
+    return text[:-3] if prefix[1] == 32 else text
 
 
-def _self_check_rsc(resource: ResourceConfig, contents: str) -> None:
-    lines = contents.splitlines()
-    if ":global AddressList" not in lines:
-        raise GeneratorError("self-check failed: AddressList missing")
-    if any("/ip/firewall/address-list remove" in line for line in lines):
-        raise GeneratorError("self-check failed: remove line present")
+def _rsc_header(lines: List[str], key: str) -> Optional[str]:
+    marker = f"# {key}="
+    return next((line[len(marker) :].strip() for line in lines if line.startswith(marker)), None)
 
-    count_line = next((line for line in lines if line.startswith("# count=")), None)
-    if not count_line:
-        raise GeneratorError("self-check failed: count header missing")
+
+def _read_rsc_header(resource_id: str, path: Path) -> Optional[Tuple[Optional[str], str]]:
+    """sha256 header (None in older files) and style of a published .rsc.
+
+    Reads up to the first address-list line only. None if the file is
+    missing or not a list for resource_id.
+    """
+    headers: Dict[str, str] = {}
+    style = "full"
     try:
-        expected_count = int(count_line.split("=", 1)[1].strip())
-    except ValueError as exc:
-        raise GeneratorError("self-check failed: count header invalid") from exc
+        with open(path, encoding="utf-8") as fh:
+            if fh.readline().rstrip("\n") != "# iplist-rsc v1":
+                return None
+            for line in fh:
+                line = line.rstrip("\n")
+                if line == _RSC_MENU:
+                    style = "compact"
+                    break
+                if line.startswith(_RSC_MENU + " "):
+                    break
+                if line.startswith("# ") and "=" in line:
+                    key, value = line[2:].split("=", 1)
+                    headers.setdefault(key, value.strip())
+    except (OSError, UnicodeDecodeError):
+        return None
+    if headers.get("resource") != resource_id:
+        return None
+    return headers.get("sha256"), style
+
+
+def _iter_rsc_prefixes(path: Path) -> Iterator[Prefix]:
+    """Addresses of a .rsc's add lines, read one line at a time.
+
+    Raises ValueError on an add line whose address does not parse.
+    """
+    in_menu = False
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.rstrip("\n")
+            command = _rsc_command(line, in_menu)
+            in_menu = _rsc_in_menu(line, in_menu)
+            if command is None or not command.startswith("add "):
+                continue
+            match = _RSC_ADDRESS_RE.search(command)
+            record = _parse_ipv4(match.group(1)) if match else None
+            if record is None:
+                raise ValueError(f"unusable add line in {path}")
+            yield record
 
-    add_lines = [
-        line for line in lines if line.startswith("/ip/firewall/address-list add ")
-    ]
-    for line in add_lines:
-        if "list=$AddressList" not in line:
-            raise GeneratorError("self-check failed: add line missing $AddressList")
-        if f"comment=\"iplist:auto:{resource.resource_id}\"" not in line:
-            raise GeneratorError("self-check failed: add line missing comment tag")
-    add_count = len(add_lines)
-    if add_count < 1:
-        raise GeneratorError("self-check failed: add_count < 1")
-    if add_count != expected_count:
-        raise GeneratorError("self-check failed: count header mismatch")
 
+def _read_published_prefixes(path: Path) -> Optional[PrefixSet]:
+    try:
+        return PrefixSet(_iter_rsc_prefixes(path))
+    except (OSError, UnicodeDecodeError, ValueError):
+        return None
+
+
+def _diff_published(
+    path: Path, networks: PrefixSet
+) -> Optional[Tuple[str, PrefixSet, PrefixSet]]:
+    """Digest of the list published at path and what networks adds to and removes from it.
+
+    One merge over the file, read a line at a time in the (address, length)
+    order every dist file is written in, so memory grows with the change
+    rather than the list. None if the file is unusable.
+    """
+    base = hashlib.sha256()
+    added: List[Prefix] = []
+    removed: List[Prefix] = []
+    new = iter(networks)
+    current = next(new, None)
+    last = None
+    try:
+        for prefix in _iter_rsc_prefixes(path):
+            if last is not None and prefix <= last:
+                return _diff_unordered(path, networks)
+            last = prefix
+            base.update(f"{_format_prefix(prefix)}\n".encode("ascii"))
+            while current is not None and current < prefix:
+                added.append(current)
+                current = next(new, None)
+            if current == prefix:
+                current = next(new, None)
+            else:
+                removed.append(prefix)
+    except (OSError, UnicodeDecodeError, ValueError):
+        return None
+    while current is not None:
+        added.append(current)
+        current = next(new, None)
+    return base.hexdigest(), PrefixSet.from_sorted(added), PrefixSet.from_sorted(removed)
+
+
+def _diff_unordered(
+    path: Path, networks: PrefixSet
+) -> Optional[Tuple[str, PrefixSet, PrefixSet]]:
+    # Files not written by this generator need not be sorted or duplicate-free.
+    old_networks = _read_published_prefixes(path)
+    if old_networks is None:
+        return None
+    return (
+        _prefix_digest(old_networks),
+        networks.difference(old_networks),
+        old_networks.difference(networks),
+    )
 
-def generate_resource(
-    resource_id: str,
-    base_dir: Path,
-    allow_cache: bool = False,
-    allow_stale_cache: bool = False,
-    collapse: str = "none",
-) -> Path:
-    resources_dir = base_dir / "resources"
-    dist_dir = base_dir / "dist"
-    dist_dir.mkdir(parents=True, exist_ok=True)
 
-    config_path = resources_dir / f"{resource_id}.yaml"
+def _read_published_rsc(
+    resource_id: str, path: Path
+) -> Optional[Tuple[Optional[str], PrefixSet, str]]:
+    """sha256 header (None in older files), prefixes and style of a published .rsc.
+
+    None if the file is missing or unusable.
+    """
+    header = _read_rsc_header(resource_id, path)
+    if header is None:
+        return None
+    prefixes = _read_published_prefixes(path)
+    if prefixes is None:
+        return None
+    return header[0], prefixes, header[1]
+
+
+def _render_delta_rsc(
+    resource: ResourceConfig,
+    base_digest: str,
+    digest: str,
+    count: int,
+    added: PrefixSet,
+    removed: PrefixSet,
+) -> Iterator[str]:
+    """Lines of dist/<resource>.delta.rsc without line endings, produced lazily."""
+    yield "# iplist-rsc-delta v1"
+    yield f"# resource={resource.resource_id}"
+    yield f"# base={base_digest}"
+    yield f"# sha256={digest}"
+    yield f"# generated={_iso_utc_now()}"
+    yield f"# count={count}"
+    yield f"# added={len(added)}"
+    yield f"# removed={len(removed)}"
+    yield ""
+    tag = f"comment=\"iplist:auto:{resource.resource_id}\""
+    # Adds go first so the list is never missing more than the removed entries.
+    yield ":global AddressList"
+    for net in added:
+        yield f"{_RSC_ADD}{_format_prefix(net)} {tag}"
+    for net in removed:
+        yield (
+            f"{_RSC_MENU} remove "
+            f"[find list=$AddressList address=\"{_routeros_address(net)}\" {tag}]"
+        )
+
+
+class _DeltaCheck:
+    """Self-check of a .delta.rsc, fed one line at a time while it is written."""
+
+    def __init__(self, resource: ResourceConfig) -> None:
+        self.tag = f"comment=\"iplist:auto:{resource.resource_id}\""
+        self.lines = 0
+        self.has_address_list = False
+        self.headers: Dict[str, str] = {}
+        self.counts = {"added": 0, "removed": 0}
+
+    def feed(self, line: str) -> None:
+        if "\r" in line or "\n" in line:
+            raise GeneratorError("self-check failed: line break inside a line")
+        self.lines += 1
+        if self.lines == 1 and line != "# iplist-rsc-delta v1":
+            raise GeneratorError("self-check failed: delta sentinel missing")
+        if line.startswith(f"{_RSC_MENU} add "):
+            self.counts["added"] += 1
+        elif line.startswith(f"{_RSC_MENU} remove "):
+            self.counts["removed"] += 1
+        else:
+            if line == ":global AddressList":
+                self.has_address_list = True
+            elif line.startswith("# ") and "=" in line:
+                key, value = line[2:].split("=", 1)
+                self.headers.setdefault(key, value.strip())
+            return
+        if "list=$AddressList" not in line:
+            raise GeneratorError("self-check failed: delta line missing $AddressList")
+        if self.tag not in line:
+            raise GeneratorError("self-check failed: delta line missing comment tag")
+
+    def finish(self) -> None:
+        if self.lines == 0:
+            raise GeneratorError("self-check failed: delta sentinel missing")
+        if not self.has_address_list:
+            raise GeneratorError("self-check failed: AddressList missing")
+        if not self.headers.get("base") or not self.headers.get("sha256"):
+            raise GeneratorError("self-check failed: version headers missing")
+        for key, actual in self.counts.items():
+            if self.headers.get(key) != str(actual):
+                raise GeneratorError(f"self-check failed: {key} header mismatch")
+
+
+def _load_resource(resource_id: str, base_dir: Path) -> ResourceConfig:
+    config_path = base_dir / "resources" / f"{resource_id}.yaml"
     if not config_path.exists():
         raise GeneratorError(f"resource config not found: {config_path}")
 
     resource = load_resource_config(config_path)
     if resource.resource_id != resource_id:
         raise GeneratorError("resource_id mismatch between file and contents")
+    return resource
+
+
+def collect_networks(
+    resource: ResourceConfig,
+    base_dir: Path,
+    allow_cache: bool = False,
+    allow_stale_cache: bool = False,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    result: Optional[ResourceResult] = None,
+    client: Optional[HttpClient] = None,
+    asn_cache_ttl: float = 0.0,
+    asn_lookup: Optional[AsnLookup] = None,
+) -> PrefixSet:
+    if client is None:
+        with HttpClient() as own_client:
+            return collect_networks(
+                resource,
+                base_dir,
+                allow_cache,
+                allow_stale_cache,
+                max_concurrency,
+                result,
+                own_client,
+                asn_cache_ttl,
+                asn_lookup,
+            )
 
-    all_prefixes: List[str] = []
+    deadline = client.retry.deadline()
     if resource.source_type == "asn":
         if not resource.asns:
             raise GeneratorError("asn source missing asns")
-        for asn in resource.asns:
-            all_prefixes.extend(fetch_prefixes_for_asn(asn))
+        cache = AsnCachePolicy(base_dir, allow_cache, allow_stale_cache, asn_cache_ttl)
+        prefixes = fetch_prefixes_for_asns(
+            resource.asns, max_concurrency, client, deadline, cache, result, asn_lookup
+        )
     else:
-        all_prefixes.extend(fetch_prefixes_for_url(resource, base_dir, allow_cache, allow_stale_cache))
+        prefixes = _dedup_sort(
+            fetch_prefixes_for_url(
+                resource, base_dir, allow_cache, allow_stale_cache, result, client, deadline
+            )
+        )
+
+    if not prefixes:
+        raise GeneratorError("no IPv4 prefixes after filtering")
+    return prefixes
+
+
+def analyze_resource(
+    resource_id: str,
+    base_dir: Path,
+    allow_cache: bool = False,
+    allow_stale_cache: bool = False,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    client: Optional[HttpClient] = None,
+    asn_cache_ttl: float = 0.0,
+) -> tuple[int, int, dict[str, int]]:
+    resource = _load_resource(resource_id, base_dir)
+    networks = collect_networks(
+        resource,
+        base_dir,
+        allow_cache,
+        allow_stale_cache,
+        max_concurrency,
+        client=client,
+        asn_cache_ttl=asn_cache_ttl,
+    )
+    shadowed, offenders = _analyze_shadowed(networks)
+    return len(networks), shadowed, offenders
+
 
-    networks = _dedup_sort(_normalize_ipv4(all_prefixes))
+def generate_resource(
+    resource_id: str,
+    base_dir: Path,
+    allow_cache: bool = False,
+    allow_stale_cache: bool = False,
+    collapse: str = "none",
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    result: Optional[ResourceResult] = None,
+    client: Optional[HttpClient] = None,
+    max_entries: Optional[int] = None,
+    asn_cache_ttl: float = 0.0,
+    asn_lookup: Optional[AsnLookup] = None,
+    formats: Iterable[str] = (),
+    rsc_style: str = "full",
+    chunk_entries: Optional[int] = None,
+) -> Path:
+    if collapse not in COLLAPSE_MODES:
+        raise GeneratorError(f"invalid collapse mode: {collapse}")
+    if rsc_style not in RSC_STYLES:
+        raise GeneratorError(f"invalid rsc style: {rsc_style}")
+    if chunk_entries is not None and chunk_entries < 1:
+        raise GeneratorError("chunk_entries must be >= 1")
+    formats = tuple(dict.fromkeys(formats))
+    unknown = [fmt for fmt in formats if fmt not in DIST_FORMATS]
+    if unknown:
+        raise GeneratorError(f"invalid dist formats: {', '.join(unknown)}")
+    if max_entries is not None and collapse != "aggregate":
+        raise GeneratorError("max_entries requires collapse=aggregate")
+    dist_dir = base_dir / "dist"
+    dist_dir.mkdir(parents=True, exist_ok=True)
+
+    resource = _load_resource(resource_id, base_dir)
+    networks = collect_networks(
+        resource,
+        base_dir,
+        allow_cache,
+        allow_stale_cache,
+        max_concurrency,
+        result,
+        client,
+        asn_cache_ttl,
+        asn_lookup,
+    )
+    overcovered = 0
     if collapse == "shadowed":
-        networks = collapse_shadowed(networks)
-    contents = _render_rsc(resource, networks)
-    contents = contents.replace("\r\n", "\n").replace("\r", "\n")
+        networks = _collapse_shadowed(networks)
+    elif collapse == "aggregate" and max_entries is None:
+        networks = _aggregate(networks)
+    elif collapse == "aggregate":
+        networks, overcovered = _aggregate_to_budget(networks, max_entries)
 
     tmp_path = dist_dir / f"{resource_id}.rsc.tmp"
     final_path = dist_dir / f"{resource_id}.rsc"
+    delta_tmp_path = dist_dir / f"{resource_id}.delta.rsc.tmp"
+    delta_path = dist_dir / f"{resource_id}.delta.rsc"
+    format_paths = {fmt: dist_dir / f"{resource_id}.{fmt}" for fmt in formats}
+    format_tmp_paths = {
+        fmt: path.with_name(path.name + ".tmp") for fmt, path in format_paths.items()
+    }
+
+    # An unchanged list keeps its file (and its generated= timestamp), so
+    # nothing downstream sees a change; the existing delta stays valid too.
+    # Only the header is read to decide that; the old entries are read (one
+    # line at a time) just when a delta has to be written.
+    digest = _prefix_digest(networks)
+    previous = _read_rsc_header(resource.resource_id, final_path)
+    if (
+        previous is not None
+        and previous[0] == digest
+        and previous[1] == rsc_style
+        and all(path.exists() for path in format_paths.values())
+        and _chunks_current(dist_dir, resource_id, digest, chunk_entries)
+    ):
+        if result is not None:
+            result.path = final_path
+            result.count = len(networks)
+            result.overcovered = overcovered
+        return final_path
+
+    # The delta moves a router from the previously published list to this one;
+    # without a usable previous list there is nothing to diff against. When
+    # only the files around the list are being rewritten (style, formats,
+    # chunks), the published delta still leads to this very list: keep it.
+    same_list = previous is not None and previous[0] == digest
+    delta_lines = None
+    diff = None
+    if previous is not None and not same_list:
+        diff = _diff_published(final_path, networks)
+    if diff is not None:
+        base_digest, added, removed = diff
+        delta_lines = _render_delta_rsc(
+            resource, base_digest, digest, len(networks), added, removed
+        )
+    chunk_sizes = None
+    if chunk_entries is not None:
+        chunk_sizes = _plan_chunks(
+            resource_id,
+            ((net, resource.resource_id) for net in networks),
+            len(networks),
+            digest,
+            rsc_style,
+            chunk_entries,
+        )
 
     try:
-        with open(tmp_path, "w", encoding="utf-8", newline="\n") as fh:
-            fh.write(contents)
-        _self_check_rsc(resource, tmp_path.read_text())
+        _write_checked_rsc(
+            tmp_path, _render_rsc(resource, networks, digest, rsc_style), {resource.resource_id}
+        )
+        if delta_lines is not None:
+            _write_checked_lines(delta_tmp_path, delta_lines, _DeltaCheck(resource))
+        if format_tmp_paths:
+            _write_dist_formats(format_tmp_paths, resource, networks, digest)
+        chunks = []
+        if chunk_sizes is not None:
+            chunks = _write_chunks(
+                dist_dir,
+                resource_id,
+                ((net, resource.resource_id) for net in networks),
+                len(networks),
+                chunk_sizes,
+                digest,
+                rsc_style,
+                chunk_entries,
+                {resource.resource_id},
+            )
+        os.replace(tmp_path, final_path)
+        if delta_lines is not None:
+            os.replace(delta_tmp_path, delta_path)
+        elif not same_list:
+            delta_path.unlink(missing_ok=True)
+        # Formats not asked for this time would now be out of date.
+        for fmt in DIST_FORMATS:
+            if fmt in format_tmp_paths:
+                os.replace(format_tmp_paths[fmt], format_paths[fmt])
+            else:
+                (dist_dir / f"{resource_id}.{fmt}").unlink(missing_ok=True)
+        _publish_chunks(dist_dir, resource_id, chunks)
+    except Exception as exc:
+        tmp_path.unlink(missing_ok=True)
+        delta_tmp_path.unlink(missing_ok=True)
+        for path in format_tmp_paths.values():
+            path.unlink(missing_ok=True)
+        for path in dist_dir.glob(f"{resource_id}.*.rsc.tmp"):
+            path.unlink(missing_ok=True)
+        raise GeneratorError(f"failed to write {final_path}") from exc
+
+    if result is not None:
+        result.path = final_path
+        result.count = len(networks)
+        result.overcovered = overcovered
+        result.changed = True
+    return final_path
+
+
+def _render_bundle_rsc(
+    bundle_id: str,
+    resource_ids: List[str],
+    entries: List[Tuple[Prefix, str]],
+    digest: str,
+    style: str = "full",
+) -> Iterator[str]:
+    yield "# iplist-rsc v1"
+    yield f"# resource={bundle_id}"
+    yield f"# resources={','.join(resource_ids)}"
+    yield f"# generated={_iso_utc_now()}"
+    yield f"# count={len(entries)}"
+    yield f"# sha256={digest}"
+    yield ""
+    yield ":global AddressList"
+    yield from _rsc_add_lines(entries, style)
+
+
+def _bundle_digest(entries: List[Tuple[Prefix, str]]) -> str:
+    # Owners are part of the digest: a prefix moving between resources changes its tag.
+    digest = hashlib.sha256()
+    for net, resource_id in entries:
+        digest.update(f"{_format_prefix(net)} {resource_id}\n".encode("ascii"))
+    return digest.hexdigest()
+
+
+def generate_bundle(
+    bundle_id: str,
+    resource_ids: List[str],
+    base_dir: Path,
+    result: Optional[ResourceResult] = None,
+    rsc_style: str = "full",
+    chunk_entries: Optional[int] = None,
+) -> Path:
+    """Merge published resource lists into one file, collapsed across resources.
+
+    Works from dist/<resource>.rsc, so run it after generating the resources.
+    Every entry keeps the comment tag of the first resource (in the given
+    order) that lists it.
+    """
+    if not resource_ids:
+        raise GeneratorError(f"bundle {bundle_id} has no resources")
+    if rsc_style not in RSC_STYLES:
+        raise GeneratorError(f"invalid rsc style: {rsc_style}")
+    if chunk_entries is not None and chunk_entries < 1:
+        raise GeneratorError("chunk_entries must be >= 1")
+    dist_dir = base_dir / "dist"
+    owners: Dict[Prefix, str] = {}
+    for resource_id in resource_ids:
+        published = _read_published_rsc(resource_id, dist_dir / f"{resource_id}.rsc")
+        if published is None:
+            raise GeneratorError(f"no usable dist file for {resource_id}")
+        for net in published[1]:
+            owners.setdefault(net, resource_id)
+    entries = [(net, owners[net]) for net in _collapse_shadowed(owners)]
+
+    tmp_path = dist_dir / f"{bundle_id}.rsc.tmp"
+    final_path = dist_dir / f"{bundle_id}.rsc"
+
+    digest = _bundle_digest(entries)
+    previous = _read_published_rsc(bundle_id, final_path)
+    if (
+        previous is not None
+        and previous[0] == digest
+        and previous[2] == rsc_style
+        and _chunks_current(dist_dir, bundle_id, digest, chunk_entries)
+    ):
+        if result is not None:
+            result.path = final_path
+            result.count = len(entries)
+        return final_path
+    chunk_sizes = None
+    if chunk_entries is not None:
+        chunk_sizes = _plan_chunks(
+            bundle_id, entries, len(entries), digest, rsc_style, chunk_entries
+        )
+
+    try:
+        _write_checked_rsc(
+            tmp_path,
+            _render_bundle_rsc(bundle_id, resource_ids, entries, digest, rsc_style),
+            set(resource_ids),
+        )
+        chunks = []
+        if chunk_sizes is not None:
+            chunks = _write_chunks(
+                dist_dir,
+                bundle_id,
+                entries,
+                len(entries),
+                chunk_sizes,
+                digest,
+                rsc_style,
+                chunk_entries,
+                set(resource_ids),
+            )
         os.replace(tmp_path, final_path)
+        _publish_chunks(dist_dir, bundle_id, chunks)
     except Exception as exc:
-        if tmp_path.exists():
-            tmp_path.unlink(missing_ok=True)
+        tmp_path.unlink(missing_ok=True)
+        for path in dist_dir.glob(f"{bundle_id}.*.rsc.tmp"):
+            path.unlink(missing_ok=True)
         raise GeneratorError(f"failed to write {final_path}") from exc
 
+    if result is not None:
+        result.path = final_path
+        result.count = len(entries)
+        result.changed = True
     return final_path
 
 
+def _run_resource(resource_id: str, base_dir: Path, options: dict) -> ResourceResult:
+    result = ResourceResult(resource_id=resource_id)
+    started = time.monotonic()
+    try:
+        generate_resource(resource_id, base_dir, result=result, **options)
+    except GeneratorError as exc:
+        result.error = str(exc)
+    except Exception as exc:
+        # Anything else (a full disk, a permission error) still only fails
+        # this resource; the other workers keep going.
+        result.error = f"{type(exc).__name__}: {exc}"
+    result.elapsed = time.monotonic() - started
+    return result
+
+
 def generate_all(
     base_dir: Path,
     allow_cache: bool = False,
     allow_stale_cache: bool = False,
     collapse: str = "none",
-) -> List[Path]:
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    jobs: int = DEFAULT_JOBS,
+    client: Optional[HttpClient] = None,
+    max_entries: Optional[int] = None,
+    asn_cache_ttl: float = 0.0,
+    formats: Iterable[str] = (),
+    rsc_style: str = "full",
+    chunk_entries: Optional[int] = None,
+) -> List[ResourceResult]:
     resources_dir = base_dir / "resources"
     if not resources_dir.exists():
         raise GeneratorError("resources directory not found")
-
-    results = []
-    for path in sorted(resources_dir.glob("*.yaml")):
-        resource = load_resource_config(path)
-        results.append(
-            generate_resource(
-                resource.resource_id,
+    if jobs < 1:
+        raise GeneratorError("jobs must be >= 1")
+    if client is None:
+        with HttpClient() as own_client:
+            return generate_all(
                 base_dir,
                 allow_cache,
                 allow_stale_cache,
                 collapse,
+                max_concurrency,
+                jobs,
+                own_client,
+                max_entries,
+                asn_cache_ttl,
+                formats,
+                rsc_style,
+                chunk_entries,
             )
-        )
 
-    return results
+    # Every resource succeeds or fails on its own; each one writes through its
+    # own tmp file, so concurrent resources never share an output path.
+    resource_ids = [path.stem for path in sorted(resources_dir.glob("*.yaml"))]
+    options = {
+        "allow_cache": allow_cache,
+        "allow_stale_cache": allow_stale_cache,
+        "collapse": collapse,
+        "max_concurrency": max_concurrency,
+        "client": client,
+        "max_entries": max_entries,
+        "asn_cache_ttl": asn_cache_ttl,
+        # Resources sharing an ASN (e.g. everything feeding one bundle) reuse
+        # a single RIPEstat request per run.
+        "asn_lookup": AsnLookup(),
+        "formats": tuple(formats),
+        "rsc_style": rsc_style,
+        "chunk_entries": chunk_entries,
+    }
+    if jobs == 1:
+        return [_run_resource(resource_id, base_dir, options) for resource_id in resource_ids]
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = [
+            pool.submit(_run_resource, resource_id, base_dir, options) for resource_id in resource_ids
+        ]
+        return [future.result() for future in futures]
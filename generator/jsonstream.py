@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import codecs
+import json
+from typing import Iterable, Iterator
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = "0123456789+-.eE"
+_DECODER = json.JSONDecoder()
+
+
+class JsonStream:
+    """Incremental reader over a JSON document delivered as byte chunks.
+
+    Containers are walked member by member, so memory is bounded by the
+    largest leaf value (e.g. one prefix object) instead of the whole document.
+    Malformed input raises ValueError.
+    """
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        for chunk in self._chunks:
+            text = self._decoder.decode(chunk)
+            if text:
+                if self._pos:
+                    self._buf = self._buf[self._pos :]
+                    self._pos = 0
+                self._buf += text
+                return True
+        self._buf += self._decoder.decode(b"", final=True)
+        self._eof = True
+        return False
+
+    def peek(self) -> str:
+        pos = self._pos
+        if pos < len(self._buf):
+            char = self._buf[pos]
+            if char not in _WHITESPACE:
+                return char
+        while True:
+            buf = self._buf
+            pos = self._pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at offset {self._pos}")
+        self._pos += 1
+
+    def value(self) -> object:
+        """Decode the next value in full (use for small values only)."""
+        if not self.peek():
+            raise ValueError("unexpected end of JSON input")
+        wanted = 0
+        while True:
+            available = len(self._buf) - self._pos
+            if available >= wanted:
+                try:
+                    obj, end = _DECODER.raw_decode(self._buf, self._pos)
+                except json.JSONDecodeError:
+                    end = -1
+                # A number cut by a chunk boundary ("12" of "12.5e3") decodes
+                # fine, so it only counts once a non-number character follows.
+                if end != -1 and end < len(self._buf) and self._buf[end] not in _NUMBER_CHARS:
+                    self._pos = end
+                    return obj
+                # Grow geometrically so large values are not re-decoded per chunk.
+                wanted = max(available * 2, 1)
+            if not self._fill():
+                try:
+                    obj, end = _DECODER.raw_decode(self._buf, self._pos)
+                except json.JSONDecodeError as exc:
+                    raise ValueError("malformed JSON value") from exc
+                self._pos = end
+                return obj
+
+    def items(self) -> Iterator[object]:
+        """Yield the elements of the array at the current position."""
+        for _ in self.elements():
+            yield self.value()
+
+    def elements(self) -> Iterator[None]:
+        """Step through the array at the current position without decoding it.
+
+        Each step leaves the stream at the next element, which the caller must
+        consume (value(), items(), keys(), elements() or skip()) before the next.
+        """
+        self._expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield None
+            sep = self.peek()
+            self._pos += 1
+            if sep == "]":
+                return
+            if sep != ",":
+                raise ValueError("malformed JSON array")
+
+    def keys(self) -> Iterator[str]:
+        """Yield the keys of the object at the current position.
+
+        The caller must consume each member's value (value(), items(),
+        keys() or skip()) before asking for the next key.
+        """
+        self._expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise ValueError("malformed JSON object key")
+            key = self.value()
+            self._expect(":")
+            yield key  # type: ignore[misc]
+            sep = self.peek()
+            self._pos += 1
+            if sep == "}":
+                return
+            if sep != ",":
+                raise ValueError("malformed JSON object")
+
+    def skip(self) -> None:
+        # Arrays are the only containers that grow with feed size (prefix lists),
+        # so only they are walked; each element is decoded whole and dropped.
+        if self.peek() == "[":
+            for _ in self.items():
+                pass
+        else:
+            self.value()
+
+    def finish(self) -> None:
+        if self.peek():
+            raise ValueError("extra data after JSON document")
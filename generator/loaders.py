@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+import re
+import time
+from typing import List, Optional
+
+import yaml
+
+from .core import GeneratorError, ResourceResult, generate_bundle
+
+LOADER_TEMPLATE = Path("routeros") / "loader.rsc.in"
+REGIONS_CONFIG = Path("regions.yaml")
+
+_PLACEHOLDER_RE = re.compile(r"\{\{([A-Z_]+)\}\}")
+_REGION_RE = re.compile(r"[a-z0-9_]+")
+
+
+@dataclass(frozen=True)
+class RegionConfig:
+    region: str
+    list_name: str
+    resources: List[str]
+    bundle: bool = False
+    chunked: bool = False
+
+    @property
+    def bundle_id(self) -> str:
+        return f"bundle_{self.region}"
+
+    @property
+    def loader_resources(self) -> List[str]:
+        return [self.bundle_id] if self.bundle else self.resources
+
+
+@dataclass
+class LoaderResult:
+    """Rendered loader plus what its resources cost on the router (from dist/)."""
+
+    region: str
+    path: Optional[Path] = None
+    resources: int = 0
+    entries: int = 0
+    bytes: int = 0
+    missing: List[str] = field(default_factory=list)
+
+
+def load_regions(base_dir: Path) -> List[RegionConfig]:
+    path = base_dir / REGIONS_CONFIG
+    if not path.exists():
+        raise GeneratorError(f"regions config not found: {path}")
+    try:
+        data = yaml.safe_load(path.read_text())
+    except Exception as exc:  # pragma: no cover - validated by callers
+        raise GeneratorError(f"failed to read config {path}") from exc
+
+    regions = data.get("regions") if isinstance(data, dict) else None
+    if not isinstance(regions, dict) or not regions:
+        raise GeneratorError(f"invalid regions in {path}")
+
+    known = {p.stem for p in (base_dir / "resources").glob("*.yaml")}
+    result = []
+    for region, spec in regions.items():
+        if not isinstance(region, str) or not _REGION_RE.fullmatch(region):
+            raise GeneratorError(f"invalid region name {region!r} in {path}")
+        if not isinstance(spec, dict):
+            raise GeneratorError(f"invalid region {region} in {path}")
+        list_name = spec.get("list_name")
+        resources = spec.get("resources") or []
+        bundle = spec.get("bundle", False)
+        chunked = spec.get("chunked", False)
+        if not list_name or not isinstance(list_name, str):
+            raise GeneratorError(f"invalid list_name for region {region} in {path}")
+        if not isinstance(resources, list) or not all(isinstance(r, str) for r in resources):
+            raise GeneratorError(f"invalid resources for region {region} in {path}")
+        if not isinstance(bundle, bool):
+            raise GeneratorError(f"invalid bundle flag for region {region} in {path}")
+        if not isinstance(chunked, bool):
+            raise GeneratorError(f"invalid chunked flag for region {region} in {path}")
+        unknown = [r for r in resources if r not in known]
+        if unknown:
+            raise GeneratorError(f"unknown resources for region {region}: {', '.join(unknown)}")
+        result.append(
+            RegionConfig(
+                region=region,
+                list_name=list_name,
+                resources=resources,
+                bundle=bundle,
+                chunked=chunked,
+            )
+        )
+    return result
+
+
+def _render_resources(resources: List[str]) -> str:
+    if not resources:
+        return '[:toarray ""]'
+    items = ";\n".join(f'  "{resource}"' for resource in resources)
+    return "{\n" + items + "\n}"
+
+
+def render_loader(
+    template: str, region: str, list_name: str, resources: List[str], chunked: bool = False
+) -> str:
+    values = {
+        "REGION": region.upper(),
+        "LIST_NAME": list_name,
+        "RESOURCES": _render_resources(resources),
+        "CHUNKED": "true" if chunked else "false",
+    }
+
+    def substitute(match: re.Match) -> str:
+        key = match.group(1)
+        if key not in values:
+            raise GeneratorError(f"unknown loader template placeholder: {key}")
+        return values[key]
+
+    return _PLACEHOLDER_RE.sub(substitute, template)
+
+
+def write_loader(
+    base_dir: Path, region: str, list_name: str, resources: List[str], chunked: bool = False
+) -> Path:
+    template_path = base_dir / LOADER_TEMPLATE
+    if not template_path.exists():
+        raise GeneratorError(f"loader template not found: {template_path}")
+    contents = render_loader(template_path.read_text(), region, list_name, resources, chunked)
+
+    final_path = base_dir / "routeros" / f"loader_{region.lower()}.rsc"
+    tmp_path = final_path.with_name(final_path.name + ".tmp")
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="\n") as fh:
+            fh.write(contents)
+        if "{{" in contents:
+            raise GeneratorError("unrendered placeholder in loader")
+        tmp_path.replace(final_path)
+    except Exception as exc:
+        tmp_path.unlink(missing_ok=True)
+        raise GeneratorError(f"failed to write {final_path}") from exc
+    return final_path
+
+
+def _dist_cost(base_dir: Path, resource_id: str) -> Optional[tuple[int, int]]:
+    path = base_dir / "dist" / f"{resource_id}.rsc"
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            if line.startswith("# count="):
+                count = line.split("=", 1)[1].strip()
+                return (int(count), path.stat().st_size) if count.isdigit() else None
+            if not line.startswith("#"):
+                break
+    return None
+
+
+def _select_regions(base_dir: Path, region: Optional[str]) -> List[RegionConfig]:
+    regions = load_regions(base_dir)
+    if region is not None:
+        regions = [r for r in regions if r.region == region]
+        if not regions:
+            raise GeneratorError(f"region not found in {REGIONS_CONFIG}: {region}")
+    return regions
+
+
+def generate_loaders(base_dir: Path, region: Optional[str] = None) -> List[LoaderResult]:
+    results = []
+    for config in _select_regions(base_dir, region):
+        resources = config.loader_resources
+        result = LoaderResult(region=config.region, resources=len(resources))
+        result.path = write_loader(
+            base_dir, config.region, config.list_name, resources, config.chunked
+        )
+        for resource_id in resources:
+            cost = _dist_cost(base_dir, resource_id)
+            if cost is None:
+                result.missing.append(resource_id)
+                continue
+            result.entries += cost[0]
+            result.bytes += cost[1]
+        results.append(result)
+    return results
+
+
+def generate_bundles(
+    base_dir: Path,
+    region: Optional[str] = None,
+    rsc_style: str = "full",
+    chunk_entries: Optional[int] = None,
+) -> List[ResourceResult]:
+    """Write dist/bundle_<region>.rsc for every region with bundle: true.
+
+    A region named explicitly gets its bundle whatever its bundle flag.
+    """
+    results = []
+    for config in _select_regions(base_dir, region):
+        if not config.resources or (region is None and not config.bundle):
+            continue
+        result = ResourceResult(resource_id=config.bundle_id)
+        started = time.monotonic()
+        try:
+            generate_bundle(
+                config.bundle_id,
+                config.resources,
+                base_dir,
+                result=result,
+                rsc_style=rsc_style,
+                chunk_entries=chunk_entries,
+            )
+        except GeneratorError as exc:
+            result.error = str(exc)
+        result.elapsed = time.monotonic() - started
+        results.append(result)
+    return results
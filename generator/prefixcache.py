@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from array import array
+from functools import lru_cache
+import hashlib
+import os
+from pathlib import Path
+import struct
+import sys
+import tempfile
+from typing import Iterable, Optional
+
+from .prefixset import PrefixSet
+
+_MAGIC = b"IPLP"
+_FORMAT_VERSION = 1
+# magic, format version, generator fingerprint (sha256), entry count
+_HEADER = struct.Struct(">4sB32sI")
+
+
+@lru_cache(maxsize=1)
+def generator_fingerprint() -> bytes:
+    """sha256 over the generator's own sources; any code change invalidates entries."""
+    digest = hashlib.sha256()
+    for path in sorted(Path(__file__).parent.glob("*.py")):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.digest()
+
+
+def _uint32_array(values: Iterable[int] = ()) -> array:
+    typecode = "I" if array("I").itemsize == 4 else "L"
+    return array(typecode, values)
+
+
+class ParsedPrefixCache:
+    """Parsed feed results on disk, keyed by a hash of the raw response body.
+
+    Each entry is a packed array of big-endian uint32 network addresses
+    followed by one uint8 prefix length per entry. Entries written by a
+    different generator version are ignored. Once the directory grows past
+    max_bytes, the least recently used entries are removed.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.bin"
+
+    def get(self, key: str) -> Optional[PrefixSet]:
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        if len(data) < _HEADER.size:
+            return None
+        magic, version, fingerprint, count = _HEADER.unpack_from(data)
+        if (
+            magic != _MAGIC
+            or version != _FORMAT_VERSION
+            or fingerprint != generator_fingerprint()
+            or len(data) != _HEADER.size + count * 5
+        ):
+            return None
+        starts = _uint32_array()
+        starts.frombytes(data[_HEADER.size : _HEADER.size + count * 4])
+        if sys.byteorder == "little":
+            starts.byteswap()
+        lengths = data[_HEADER.size + count * 4 :]
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        # Entries were written from a PrefixSet, so they are already in order.
+        return PrefixSet.from_sorted(zip(starts, lengths))
+
+    def put(self, key: str, prefixes: PrefixSet) -> None:
+        header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, generator_fingerprint(), len(prefixes))
+        starts = _uint32_array(start for start, _ in prefixes)
+        if sys.byteorder == "little":
+            starts.byteswap()
+        lengths = bytes(plen for _, plen in prefixes)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        # A tmp name per writer: parallel resources may store the same body.
+        try:
+            fd, tmp_name = tempfile.mkstemp(dir=self.directory, prefix=path.name + ".", suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(header)
+                fh.write(starts.tobytes())
+                fh.write(lengths)
+            os.replace(tmp_name, path)
+        except OSError:
+            # The cache is an optimisation; failing to write it is not an error.
+            Path(tmp_name).unlink(missing_ok=True)
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for path in self.directory.glob("*.bin"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
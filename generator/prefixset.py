@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, Tuple
+
+try:
+    import numpy as _np
+except ImportError:  # optional: vectorised sort/dedup/collapse when installed
+    _np = None
+
+_PLEN_BITS = 8
+_PLEN_MASK = (1 << _PLEN_BITS) - 1
+_IPV4_ALL_ONES = 0xFFFFFFFF
+
+
+def backend() -> str:
+    """Which implementation sorts, deduplicates and collapses: "numpy" or "python"."""
+    return "python" if _np is None else "numpy"
+
+
+def _key(prefix: Tuple[int, int]) -> int:
+    start, plen = prefix
+    return start << _PLEN_BITS | plen
+
+
+def _view(keys: array):
+    return _np.frombuffer(keys, dtype=_np.uint64)
+
+
+def _sorted_unique(keys: array) -> array:
+    if _np is None:
+        return array("Q", sorted(set(keys)))
+    return array("Q", _np.unique(_view(keys)).tobytes())
+
+
+def _union(*parts: array) -> array:
+    if _np is None:
+        keys = set(parts[0])
+        for part in parts[1:]:
+            keys.update(part)
+        return array("Q", sorted(keys))
+    return array("Q", _np.unique(_np.concatenate([_view(part) for part in parts])).tobytes())
+
+
+def _difference(keys: array, drop: array) -> array:
+    if _np is None:
+        dropped = set(drop)
+        return array("Q", (key for key in keys if key not in dropped))
+    return array("Q", _np.setdiff1d(_view(keys), _view(drop), assume_unique=True).tobytes())
+
+
+def _without_shadowed(keys: array) -> array:
+    # Sweep in (start, prefixlen) order: CIDR blocks either nest or are
+    # disjoint, so a block is shadowed iff it ends inside an earlier one. The
+    # furthest end seen so far equals the end of the last kept block.
+    if _np is None:
+        kept = array("Q")
+        cover_end = -1
+        for key in keys:
+            end = (key >> _PLEN_BITS) | (_IPV4_ALL_ONES >> (key & _PLEN_MASK))
+            if end > cover_end:
+                kept.append(key)
+                cover_end = end
+        return kept
+    view = _view(keys)
+    if not len(view):
+        return array("Q")
+    starts = (view >> _np.uint64(_PLEN_BITS)).astype(_np.int64)
+    plens = (view & _np.uint64(_PLEN_MASK)).astype(_np.int64)
+    ends = starts | (_IPV4_ALL_ONES >> plens)
+    cover = _np.empty_like(ends)
+    cover[0] = -1
+    _np.maximum.accumulate(ends[:-1], out=cover[1:])
+    return array("Q", view[ends > cover].tobytes())
+
+
+class PrefixSet:
+    """Sorted, duplicate-free IPv4 prefixes packed as one uint64 per entry.
+
+    An entry is (network << 8 | prefixlen), so numeric order is the pipeline's
+    (address, length) order and a set costs 8 bytes per prefix instead of a
+    tuple of ints per prefix. Iteration yields (network, prefixlen) records.
+    Sets are immutable; update operations return a new set. Sorting,
+    deduplication and collapse are vectorised when NumPy is installed.
+    """
+
+    __slots__ = ("_keys",)
+
+    def __init__(self, prefixes: Iterable[Tuple[int, int]] = ()) -> None:
+        self._keys = _sorted_unique(array("Q", map(_key, prefixes)))
+
+    @classmethod
+    def _from_sorted_keys(cls, keys: array) -> PrefixSet:
+        # Callers guarantee keys are strictly increasing.
+        result = cls.__new__(cls)
+        result._keys = keys
+        return result
+
+    @classmethod
+    def from_sorted(cls, prefixes: Iterable[Tuple[int, int]]) -> PrefixSet:
+        """Build from records already in strictly increasing order, without sorting."""
+        return cls._from_sorted_keys(array("Q", map(_key, prefixes)))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        for key in self._keys:
+            yield key >> _PLEN_BITS, key & _PLEN_MASK
+
+    def __contains__(self, prefix: object) -> bool:
+        if not isinstance(prefix, tuple) or len(prefix) != 2:
+            return False
+        key = _key(prefix)
+        idx = bisect_left(self._keys, key)
+        return idx < len(self._keys) and self._keys[idx] == key
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, PrefixSet):
+            return NotImplemented
+        return self._keys == other._keys
+
+    def __repr__(self) -> str:
+        return f"PrefixSet({len(self)} prefixes)"
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._keys) * self._keys.itemsize
+
+    def update(self, prefixes: Iterable[Tuple[int, int]]) -> PrefixSet:
+        """Bulk insert: this set plus the given records."""
+        return self._from_sorted_keys(_union(self._keys, array("Q", map(_key, prefixes))))
+
+    def union(self, *others: PrefixSet) -> PrefixSet:
+        if not others:
+            return self
+        return self._from_sorted_keys(_union(self._keys, *(other._keys for other in others)))
+
+    def difference(self, other: PrefixSet) -> PrefixSet:
+        return self._from_sorted_keys(_difference(self._keys, other._keys))
+
+    def without_shadowed(self) -> PrefixSet:
+        """Drop every prefix that a shorter prefix in the set already covers."""
+        return self._from_sorted_keys(_without_shadowed(self._keys))
@@ -1,21 +1,45 @@
 from __future__ import annotations
 
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 import ipaddress
+import json
+import os
+import random
+import re
+import threading
+import time
 
 import pytest
 import requests
 import responses
 
 from generator import core as gen_core
+from generator.__main__ import main
 from generator.core import (
     GeneratorError,
+    HttpClient,
     RIPESTAT_URL,
+    ResourceResult,
+    RetryPolicy,
+    analyze_shadowed_prefixes,
     collapse_shadowed,
+    generate_all,
     generate_resource,
-    reset_stale_cache_used,
-    stale_cache_used,
 )
+from generator import prefixcache, prefixset
+from generator.prefixset import PrefixSet
+from generator.loaders import load_regions, render_loader
+
+
+@pytest.fixture(autouse=True)
+def _no_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(
+        gen_core, "DEFAULT_RETRY_POLICY", RetryPolicy(backoff_base=0.0, backoff_max=0.0)
+    )
 
 
 def _write_resource(base_dir: Path, asns=None, resource_id: str = "cloudflare") -> None:
@@ -45,6 +69,36 @@ def _write_url_resource(
     )
 
 
+@contextmanager
+def _local_server(handle):
+    """Serve ``handle(request_handler) -> (status, headers, body)`` over HTTP/1.1 keep-alive."""
+
+    class _Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self) -> None:  # noqa: N802 - http.server API
+            status, headers, body = handle(self)
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            if "Content-Length" not in headers:
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_args) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
 def _read_add_lines(path: Path) -> list[str]:
     return [line for line in path.read_text().splitlines() if line.startswith("/ip/")]
 
@@ -257,6 +311,212 @@ def test_url_timeout_does_not_overwrite(tmp_path: Path) -> None:
     assert target.read_text() == "OLD"
 
 
+@responses.activate
+def test_asn_fetch_concurrent_merges_in_config_order(tmp_path: Path) -> None:
+    _write_resource(tmp_path, asns=["AS1", "AS2", "AS3"])
+    in_flight = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def _callback(request):
+        asn = request.params["resource"]
+        with lock:
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        time.sleep({"AS1": 0.2, "AS2": 0.1, "AS3": 0.0}[asn])
+        with lock:
+            in_flight["now"] -= 1
+        prefix = {"AS1": "10.0.0.0/8", "AS2": "10.1.0.0/16", "AS3": "10.1.0.0/16"}[asn]
+        return (200, {}, json.dumps({"data": {"prefixes": [{"prefix": prefix}]}}))
+
+    responses.add_callback(responses.GET, RIPESTAT_URL, callback=_callback)
+
+    path = generate_resource("cloudflare", tmp_path, max_concurrency=3)
+    add_lines = _read_add_lines(path)
+
+    assert in_flight["peak"] > 1
+    assert len(add_lines) == 2
+    assert "address=10.0.0.0/8" in add_lines[0]
+    assert "address=10.1.0.0/16" in add_lines[1]
+
+
+@responses.activate
+def test_asn_fetch_concurrent_one_failure_aborts(tmp_path: Path) -> None:
+    _write_resource(tmp_path, asns=["AS1", "AS2"])
+    dist = tmp_path / "dist"
+    dist.mkdir(parents=True, exist_ok=True)
+    target = dist / "cloudflare.rsc"
+    target.write_text("OLD")
+
+    responses.add(
+        responses.GET,
+        RIPESTAT_URL,
+        json={"data": {"prefixes": [{"prefix": "1.1.1.0/24"}]}},
+        status=200,
+        match=[responses.matchers.query_param_matcher({"resource": "AS1"})],
+    )
+    responses.add(
+        responses.GET,
+        RIPESTAT_URL,
+        status=500,
+        match=[responses.matchers.query_param_matcher({"resource": "AS2"})],
+    )
+
+    with pytest.raises(GeneratorError):
+        generate_resource("cloudflare", tmp_path, max_concurrency=2)
+
+    assert target.read_text() == "OLD"
+
+
+@responses.activate
+def test_asn_stale_cache_used_on_non_200_and_status_error(tmp_path: Path) -> None:
+    _write_resource(tmp_path, asns=["AS1", "AS2"])
+    responses.add(
+        responses.GET,
+        RIPESTAT_URL,
+        json={"status": "ok", "data": {"prefixes": [{"prefix": "1.1.1.0/24"}]}},
+        headers={"ETag": '"as1-v1"'},
+        match=[responses.matchers.query_param_matcher({"resource": "AS1"})],
+    )
+    responses.add(
+        responses.GET,
+        RIPESTAT_URL,
+        json={"status": "ok", "data": {"prefixes": [{"prefix": "2.2.2.0/24"}]}},
+        match=[responses.matchers.query_param_matcher({"resource": "AS2"})],
+    )
+    generate_resource("cloudflare", tmp_path, max_concurrency=1)
+    assert (tmp_path / "cache" / "asn" / "AS1.etag").read_text() == '"as1-v1"'
+    assert (tmp_path / "cache" / "asn" / "AS2.json").exists()
+
+    responses.reset()
+    responses.add(
+        responses.GET,
+        RIPESTAT_URL,
+        status=503,
+        match=[responses.matchers.query_param_matcher({"resource": "AS1"})],
+    )
+    responses.add(
+        responses.GET,
+        RIPESTAT_URL,
+        json={"status": "error", "messages": [["error", "maintenance"]]},
+        match=[responses.matchers.query_param_matcher({"resource": "AS2"})],
+    )
+    with pytest.raises(GeneratorError):
+        generate_resource("cloudflare", tmp_path, max_concurrency=1)
+
+    result = ResourceResult(resource_id="cloudflare")
+    path = generate_resource(
+        "cloudflare", tmp_path, allow_stale_cache=True, max_concurrency=1, result=result
+    )
+    add_lines = _read_add_lines(path)
+
+    assert result.stale_cache_used
+    assert "address=1.1.1.0/24" in add_lines[0]
+    assert "address=2.2.2.0/24" in add_lines[1]
+
+
+@responses.activate
+def test_asn_not_modified_and_fresh_cache_skip_refetch(tmp_path: Path) -> None:
+    _write_resource(tmp_path, asns=["AS1"])
+    now = datetime.now(timezone.utc).replace(tzinfo=None).isoformat(timespec="seconds")
+    seen_etags = []
+
+    def _callback(request):
+        seen_etags.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return (304, {}, "")
+        payload = {"status": "ok", "data": {"query_time": now, "prefixes": [{"prefix": "1.1.1.0/24"}]}}
+        return (200, {"ETag": '"v1"'}, json.dumps(payload))
+
+    responses.add_callback(responses.GET, RIPESTAT_URL, callback=_callback)
+
+    # Without --allow-cache a 304 could not be used, so no validator is sent.
+    generate_resource("cloudflare", tmp_path)
+    generate_resource("cloudflare", tmp_path)
+    path = generate_resource("cloudflare", tmp_path, allow_cache=True)
+    assert seen_etags == [None, None, '"v1"']
+    assert "address=1.1.1.0/24" in _read_add_lines(path)[0]
+
+    generate_resource("cloudflare", tmp_path, allow_cache=True, asn_cache_ttl=3600)
+    assert len(seen_etags) == 3
+
+    # Without --allow-cache the TTL never short-circuits the request.
+    generate_resource("cloudflare", tmp_path, asn_cache_ttl=3600)
+    assert seen_etags[3:] == [None]
+    assert not list((tmp_path / "cache" / "asn").glob("*.tmp"))
+
+
+@responses.activate
+def test_asn_cache_ttl_ignores_cached_answers_that_are_not_objects(tmp_path: Path) -> None:
+    _write_resource(tmp_path, asns=["AS1"])
+    cache_dir = tmp_path / "cache" / "asn"
+    cache_dir.mkdir(parents=True)
+    responses.add(
+        responses.GET, RIPESTAT_URL, json={"status": "ok", "data": {"prefixes": [{"prefix": "1.1.1.0/24"}]}}
+    )
+    for cached in ("[]", '"x"'):
+        assert gen_core._ripestat_query_time(json.loads(cached)) is None
+        (cache_dir / "AS1.json").write_text(cached)
+        path = generate_resource("cloudflare", tmp_path, allow_cache=True, asn_cache_ttl=3600)
+        assert "address=1.1.1.0/24" in _read_add_lines(path)[0]
+    assert len(responses.calls) == 2
+
+
+def _fake_ripestat(prefixes_by_asn: dict, hits: dict, fail_once=()):
+    failed = set()
+    lock = threading.Lock()
+
+    def _handle(handler):
+        asn = handler.path.split("resource=", 1)[1]
+        with lock:
+            hits[asn] = hits.get(asn, 0) + 1
+            fail = asn in fail_once and asn not in failed
+            failed.add(asn)
+        if fail:
+            return 500, {}, b""
+        prefixes = [{"prefix": prefix} for prefix in prefixes_by_asn[asn]]
+        return 200, {}, json.dumps({"status": "ok", "data": {"prefixes": prefixes}}).encode()
+
+    return _local_server(_handle)
+
+
+def test_asn_lookups_shared_across_resources(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _write_resource(tmp_path, asns=["AS1", "AS2", "AS1"], resource_id="alpha")
+    _write_resource(tmp_path, asns=["AS2", "AS3"], resource_id="beta")
+    _write_resource(tmp_path, asns=["AS1", "AS3"], resource_id="gamma")
+    hits: dict = {}
+    prefixes = {"AS1": ["1.1.1.0/24"], "AS2": ["2.2.2.0/24"], "AS3": ["3.3.3.0/24"]}
+
+    with _fake_ripestat(prefixes, hits) as base_url:
+        monkeypatch.setattr(gen_core, "RIPESTAT_URL", f"{base_url}/data.json")
+        with HttpClient() as client:
+            results = generate_all(tmp_path, jobs=3, client=client)
+
+    assert all(r.ok for r in results)
+    assert hits == {"AS1": 1, "AS2": 1, "AS3": 1}
+    assert [r.count for r in results] == [2, 2, 2]
+    assert "address=3.3.3.0/24" in _read_add_lines(tmp_path / "dist" / "gamma.rsc")[1]
+
+
+def test_asn_lookup_failure_names_asn_and_falls_back(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _write_resource(tmp_path, asns=["AS1", "AS2"], resource_id="alpha")
+    _write_resource(tmp_path, asns=["AS2"], resource_id="beta")
+    hits: dict = {}
+    prefixes = {"AS1": ["1.1.1.0/24"], "AS2": ["2.2.2.0/24"]}
+
+    with _fake_ripestat(prefixes, hits, fail_once={"AS2"}) as base_url:
+        monkeypatch.setattr(gen_core, "RIPESTAT_URL", f"{base_url}/data.json")
+        with HttpClient(retry=RetryPolicy(retries=1)) as client:
+            alpha, beta = generate_all(tmp_path, client=client)
+
+    assert alpha.error is not None and alpha.error.startswith("AS2: non-200")
+    assert beta.ok and beta.count == 1
+    assert hits == {"AS1": 1, "AS2": 2}
+
+
 @responses.activate
 def test_ipv6_excluded(tmp_path: Path) -> None:
     _write_resource(tmp_path)
@@ -512,6 +772,341 @@ def test_google_cloud_json_empty_ipv4_fails_and_preserves_dist(tmp_path: Path) -
     assert target.read_text() == "OLD"
 
 
+@responses.activate
+@pytest.mark.parametrize(
+    "feed_format,body",
+    [
+        (
+            "oracle_public_ip_ranges_json",
+            json.dumps(
+                {
+                    "regions": [
+                        {"region": "eu-frankfurt-1", "cidrs": [{"cidr": "130.61.0.0/16", "tags": ["OCI"]}]},
+                        {"region": "us-ashburn-1", "cidrs": [{"cidr": "2603:c020::/35", "tags": ["OCI"]}]},
+                    ]
+                }
+            ),
+        ),
+        (
+            "azure_service_tags_json",
+            json.dumps(
+                {
+                    "values": [
+                        {
+                            "name": "AzureCloud",
+                            "properties": {"addressPrefixes": ["130.61.0.0/16", "2603:1000::/40"]},
+                        }
+                    ]
+                }
+            ),
+        ),
+        ("geo_csv", "130.61.0.0/16,DE,DE-HE,Frankfurt,\n2a03:b0c0::/32,NL,NL-NH,Amsterdam,\n"),
+    ],
+)
+def test_registered_feed_formats_extract_ipv4(tmp_path: Path, feed_format: str, body: str) -> None:
+    _write_url_resource(tmp_path, "feed", "https://example.com/feed", feed_format)
+    responses.add(responses.GET, "https://example.com/feed", body=body, status=200)
+
+    path = generate_resource("feed", tmp_path)
+
+    add_lines = _read_add_lines(path)
+    assert len(add_lines) == 1
+    assert "address=130.61.0.0/16" in add_lines[0]
+
+
+@responses.activate
+def test_parsed_prefix_cache_skips_parsing_unchanged_bodies(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(gen_core, "FEED_FORMATS", dict(gen_core.FEED_FORMATS))
+    parse_calls = []
+    plain = gen_core.FEED_FORMATS["plain_cidr"]
+
+    def _counting_parse(chunks):
+        parse_calls.append(1)
+        return plain.parse(chunks)
+
+    gen_core.register_feed_format("counted", _counting_parse, cache_ext="txt")
+    _write_url_resource(tmp_path, "telegram", "https://example.com/cidr.txt", "counted")
+    body = "1.1.1.0/24\n2.2.2.0/24\n"
+    responses.add(
+        responses.GET, "https://example.com/cidr.txt", body=body, headers={"ETag": '"v1"'}
+    )
+    responses.add(responses.GET, "https://example.com/cidr.txt", status=304)
+    responses.add(responses.GET, "https://example.com/cidr.txt", body=body)
+
+    generate_resource("telegram", tmp_path)
+    generate_resource("telegram", tmp_path, allow_cache=True)
+    path = generate_resource("telegram", tmp_path)
+    assert len(parse_calls) == 1
+    assert len(_read_add_lines(path)) == 2
+    assert len(list((tmp_path / "cache" / "parsed").glob("*.bin"))) == 1
+
+    monkeypatch.setattr(prefixcache, "generator_fingerprint", lambda: b"\x01" * 32)
+    responses.add(responses.GET, "https://example.com/cidr.txt", body=body)
+    generate_resource("telegram", tmp_path)
+    assert len(parse_calls) == 2
+
+
+def test_parsed_prefix_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache = prefixcache.ParsedPrefixCache(tmp_path, max_bytes=300)
+    entry = PrefixSet((0x01010100 + (i << 8), 24) for i in range(10))  # 41 + 50 bytes = 91
+    for idx, key in enumerate(("a", "b", "c")):
+        cache.put(key, entry)
+        os.utime(tmp_path / f"{key}.bin", (1000 + idx, 1000 + idx))
+    assert isinstance(cache.get("a"), PrefixSet) and cache.get("a") == entry
+    cache.put("d", entry)
+    assert not list(tmp_path.glob("*.tmp"))
+    assert sorted(path.stem for path in tmp_path.glob("*.bin")) == ["a", "c", "d"]
+    (tmp_path / "a.bin").write_bytes(b"IPLP")
+    assert cache.get("a") is None
+
+
+@responses.activate
+def test_custom_feed_format_gets_cache_pipeline(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(gen_core, "FEED_FORMATS", dict(gen_core.FEED_FORMATS))
+    gen_core.register_feed_format(
+        "pipe_list",
+        lambda chunks: [
+            gen_core._parse_ipv4(part) for part in b"".join(chunks).decode().strip().split("|")
+        ],
+        cache_ext="txt",
+    )
+    _write_url_resource(tmp_path, "custom", "https://example.com/custom", "pipe_list")
+    responses.add(
+        responses.GET,
+        "https://example.com/custom",
+        body="1.1.1.0/24|1.0.0.0/24",
+        status=200,
+        headers={"ETag": '"v1"'},
+    )
+    responses.add(responses.GET, "https://example.com/custom", status=304)
+
+    generate_resource("custom", tmp_path)
+    assert (tmp_path / "cache" / "custom.txt").read_text() == "1.1.1.0/24|1.0.0.0/24"
+    assert (tmp_path / "cache" / "custom.etag").read_text() == '"v1"'
+
+    path = generate_resource("custom", tmp_path, allow_cache=True)
+    assert responses.calls[1].request.headers["If-None-Match"] == '"v1"'
+    assert len(_read_add_lines(path)) == 2
+
+    with pytest.raises(GeneratorError):
+        gen_core.register_feed_format("pipe_list", lambda chunks: [])
+
+
+def test_streaming_json_feeds_match_full_parse() -> None:
+    doc = {
+        "syncToken": "1700000000",
+        "prefixes": [
+            {"ip_prefix": f"3.{i}.0.0/16", "region": "eu-central-1", "service": "AMAZON"}
+            for i in range(50)
+        ]
+        + [{"service": "S3"}],
+        "ipv6_prefixes": [{"ipv6_prefix": "2600:1f14::/35", "tags": [1, 2.5e3, None, True]}] * 20,
+        "meta": {"note": "caf\u00e9 \\\" ]}"},
+    }
+    body = json.dumps(doc).encode()
+    expected = [item["ip_prefix"] for item in doc["prefixes"] if "ip_prefix" in item]
+    parse = gen_core.FEED_FORMATS["aws_ip_ranges_json"].parse
+    for size in (1, 2, 3, 7, 64, len(body)):
+        chunks = [body[i : i + size] for i in range(0, len(body), size)]
+        assert [gen_core._format_prefix(p) for p in parse(chunks)] == expected
+
+    listing = json.dumps({"prefixes": ["1.1.1.0/24", {"prefix": "1.0.0.0/24"}], "x": [[{}]]}).encode()
+    parse_list = gen_core.FEED_FORMATS["json_prefix_list"].parse
+    assert list(parse_list([listing[i : i + 5] for i in range(0, len(listing), 5)])) == [
+        (0x01010100, 24),
+        (0x01000000, 24),
+    ]
+    with pytest.raises(GeneratorError):
+        list(parse([body[:-1]]))
+    with pytest.raises(GeneratorError):
+        list(parse([body, b"{}"]))
+
+
+def test_every_registered_feed_format_parses_incrementally() -> None:
+    docs = {
+        "fastly_public_ip_list_json": {
+            "addresses": ["23.235.32.0/20", "43.249.72.0/22"],
+            "ipv6_addresses": ["2a04:4e40::/32"],
+        },
+        "oracle_public_ip_ranges_json": {
+            "last_updated_timestamp": "2024-01-01",
+            "regions": [
+                {"region": "eu-frankfurt-1", "cidrs": [{"cidr": "130.61.0.0/16", "tags": ["OCI"]}]},
+                "junk",
+                {
+                    "region": "us-ashburn-1",
+                    "cidrs": [{"cidr": "2603:c020::/35"}, {"cidr": "129.213.0.0/16"}],
+                },
+            ],
+        },
+        "azure_service_tags_json": {
+            "changeNumber": 1,
+            "values": [
+                {
+                    "name": "AzureCloud",
+                    "id": "AzureCloud",
+                    "properties": {
+                        "region": "",
+                        "addressPrefixes": ["13.64.0.0/16", "2603:1000::/40", 5],
+                        "networkFeatures": ["API"],
+                    },
+                },
+                {"name": "Empty", "properties": {"addressPrefixes": []}},
+                {"name": "Storage", "properties": {"addressPrefixes": ["20.38.96.0/19"]}},
+            ],
+        },
+    }
+    expected = {
+        "fastly_public_ip_list_json": ["23.235.32.0/20", "43.249.72.0/22"],
+        "oracle_public_ip_ranges_json": ["130.61.0.0/16", "129.213.0.0/16"],
+        "azure_service_tags_json": ["13.64.0.0/16", "20.38.96.0/19"],
+    }
+    text = {
+        "plain_cidr": (
+            "# comment\r\n1.1.1.0/24 1.0.0.0/24\r\n\r\n2.2.2.2 # host\n",
+            ["1.1.1.0/24", "1.0.0.0/24", "2.2.2.2/32"],
+        ),
+        "geo_csv": (
+            "130.61.0.0/16,DE,DE-HE,Frankfurt,\r\n2a03:b0c0::/32,NL\n5.5.5.0/24,NL",
+            ["130.61.0.0/16", "5.5.5.0/24"],
+        ),
+    }
+    bodies = {name: (json.dumps(doc).encode(), expected[name]) for name, doc in docs.items()}
+    bodies.update({name: (body.encode(), want) for name, (body, want) in text.items()})
+    for name, (body, want) in bodies.items():
+        parse = gen_core.FEED_FORMATS[name].parse
+        for size in (1, 2, 5, 64, len(body)):
+            chunks = [body[i : i + size] for i in range(0, len(body), size)]
+            assert [gen_core._format_prefix(p) for p in parse(chunks)] == want, (name, size)
+
+    for name, body in (
+        ("fastly_public_ip_list_json", b'{"addresses": []}'),
+        ("fastly_public_ip_list_json", b'{"addresses": [1]}'),
+        ("fastly_public_ip_list_json", b'{"addresses": "1.1.1.0/24"}'),
+        ("oracle_public_ip_ranges_json", b'{"regions": []}'),
+        ("azure_service_tags_json", b'{"values": {}}'),
+        ("azure_service_tags_json", b'[]'),
+        ("geo_csv", b"# nothing\n"),
+        ("plain_cidr", b"1.1.1.0/33\n"),
+    ):
+        with pytest.raises(GeneratorError):
+            list(gen_core.FEED_FORMATS[name].parse([body]))
+
+
+def test_stream_broken_mid_body_falls_back_to_stale_cache(tmp_path: Path) -> None:
+    def _handle(handler):
+        handler.close_connection = True
+        return 200, {"Content-Length": "100000"}, b'{"prefixes":[{"ip_prefix":"9.9.9.0/24"},'
+
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cached = '{"prefixes":[{"ip_prefix":"3.5.140.0/22"}]}'
+    (cache_dir / "aws.json").write_text(cached)
+    with _local_server(_handle) as base_url:
+        _write_url_resource(tmp_path, "aws", f"{base_url}/aws.json", "aws_ip_ranges_json")
+        result = ResourceResult(resource_id="aws")
+        path = generate_resource("aws", tmp_path, allow_stale_cache=True, result=result)
+        with pytest.raises(GeneratorError):
+            generate_resource("aws", tmp_path)
+
+    assert result.stale_cache_used
+    assert "address=3.5.140.0/22" in _read_add_lines(path)[0]
+    assert (cache_dir / "aws.json").read_text() == cached
+    assert not (cache_dir / "aws.json.tmp").exists()
+
+
+def test_prefix_set_matches_python_sets() -> None:
+    rng = random.Random(21)
+    for _ in range(50):
+        a = [(rng.getrandbits(8) << 24, rng.randint(0, 32)) for _ in range(rng.randint(0, 60))]
+        b = [(rng.getrandbits(8) << 24, rng.randint(0, 32)) for _ in range(rng.randint(0, 60))]
+        left, right = PrefixSet(a), PrefixSet(b)
+        assert list(left) == sorted(set(a))
+        assert list(left.union(right)) == sorted(set(a) | set(b))
+        assert list(left.update(b)) == sorted(set(a) | set(b))
+        assert list(left.difference(right)) == sorted(set(a) - set(b))
+        assert all(prefix in left for prefix in a)
+        assert all((prefix in left) == (prefix in set(a)) for prefix in b)
+        assert PrefixSet.from_sorted(sorted(set(a))) == left
+        assert left.nbytes == 8 * len(left)
+
+    assert (0xFFFFFFFF, 32) in PrefixSet([(0xFFFFFFFF, 32)])
+
+
+def test_numpy_backend_matches_python_backend(monkeypatch: pytest.MonkeyPatch) -> None:
+    pytest.importorskip("numpy")
+
+    def _run(seed: int) -> list:
+        rng = random.Random(seed)
+        outputs = []
+        for _ in range(30):
+            size = rng.choice((0, 1, 2, 50, 2000))
+            records = []
+            for _ in range(size):
+                plen = rng.randint(0, 32)
+                addr = rng.getrandbits(32) & (0xFFFFFFFF ^ (0xFFFFFFFF >> plen))
+                records.append((addr, plen))
+            records += rng.sample(records, len(records) // 4)
+            left, right = PrefixSet(records), PrefixSet(records[: size // 2])
+            outputs.append(
+                (
+                    list(left),
+                    list(left.union(right, PrefixSet([(0, 0)]))),
+                    list(left.update([(0xFFFFFFFF, 32)])),
+                    list(left.difference(right)),
+                    list(gen_core._collapse_shadowed(records)),
+                    list(gen_core._aggregate(records)),
+                )
+            )
+        return outputs
+
+    assert prefixset.backend() == "numpy"
+    vectorised = _run(31)
+    monkeypatch.setattr(prefixset, "_np", None)
+    assert prefixset.backend() == "python"
+    assert _run(31) == vectorised
+
+
+def test_parse_ipv4_matches_ipaddress() -> None:
+    rng = random.Random(5)
+    pieces = ["0", "1", "01", "9", "10", "127", "255", "256", "999", "0000", "", " ", "a", "\u0661", "+1"]
+    samples = [
+        "::1/128",
+        "2001:db8::/32",
+        "10.0.0.0/255.255.0.0",
+        "10.0.0.0/0.0.255.255",
+        "10.0.0.1",
+        "10.0.0.0/024",
+        "10.0.0.0/33",
+        "10.0.0.0/",
+        "10.0.0.0//8",
+        "1.2.3.4/8/8",
+        "1.2.3",
+        "1.2.3.4.5",
+        3232235777,
+        b"\x0a\x00\x00\x01",
+    ]
+    for _ in range(5000):
+        addr = ".".join(rng.choice(pieces) for _ in range(rng.choice((3, 4, 4, 4, 5))))
+        plen = rng.choice(["", "/", "/0", "/8", "/24", "/32", "/33", "/07", "/1a", "/ 8", "/\u0662"])
+        samples.append(addr + plen)
+        samples.append(f"{rng.getrandbits(32) >> 24}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}/{rng.randrange(33)}")
+
+    for value in samples:
+        try:
+            net = ipaddress.ip_network(value, strict=False)
+        except ValueError:
+            with pytest.raises(ValueError):
+                gen_core._parse_ipv4(value)
+            continue
+        expected = (int(net.network_address), net.prefixlen) if net.version == 4 else None
+        assert gen_core._parse_ipv4(value) == expected, value
+
+
 def test_collapse_shadowed_removes_subnets() -> None:
     nets = [
         ipaddress.ip_network("149.154.160.0/22"),
@@ -531,6 +1126,324 @@ def test_collapse_shadowed_keeps_when_no_supernet() -> None:
     assert collapsed == sorted(nets, key=lambda n: (int(n.network_address), n.prefixlen))
 
 
+def test_collapse_shadowed_keeps_repeated_inputs() -> None:
+    net = ipaddress.ip_network("10.0.0.0/24")
+    nets = [net, ipaddress.ip_network("10.0.0.0/25"), net]
+    assert collapse_shadowed(nets) == [net, net]
+
+
+def test_collapse_shadowed_matches_bruteforce() -> None:
+    rng = random.Random(7)
+    nets = [
+        ipaddress.ip_network((rng.getrandbits(12) << 20, rng.randint(4, 24)), strict=False)
+        for _ in range(300)
+    ]
+    nets += nets[:20]
+    expected = sorted(
+        {
+            net
+            for net in nets
+            if not any(other.prefixlen < net.prefixlen and net.subnet_of(other) for other in nets)
+        },
+        key=lambda n: (int(n.network_address), n.prefixlen),
+    )
+    assert collapse_shadowed(sorted(set(nets), key=lambda n: (int(n.network_address), n.prefixlen))) == expected
+
+
+def test_aggregate_matches_ipaddress_collapse() -> None:
+    rng = random.Random(13)
+    for _ in range(100):
+        nets = [
+            ipaddress.ip_network((rng.getrandbits(10) << 22 >> rng.randint(0, 8), rng.randint(8, 24)), strict=False)
+            for _ in range(rng.randint(1, 80))
+        ]
+        prefixes = [(int(net.network_address), net.prefixlen) for net in nets]
+        expected = [(int(net.network_address), net.prefixlen) for net in ipaddress.collapse_addresses(nets)]
+        assert list(gen_core._aggregate(prefixes)) == expected
+
+    assert list(gen_core._aggregate([(0x01B20400, 24), (0x01B20500, 24), (0x01B20600, 23)])) == [(0x01B20400, 22)]
+
+
+def test_aggregate_budget_overcovers_cheapest_first() -> None:
+    def _addresses(prefixes) -> int:
+        return sum(1 << (32 - plen) for _, plen in gen_core._aggregate(prefixes))
+
+    # 10.0.0.0/24 + 10.0.2.0/24 cost 512 extra as 10.0.0.0/22; 10.1.0.0/24 and
+    # 10.3.0.0/24 would cost far more, so the /22 merge comes first.
+    prefixes = [(0x0A000000, 24), (0x0A000200, 24), (0x0A010000, 24), (0x0A030000, 24)]
+    merged, extra = gen_core._aggregate_to_budget(prefixes, 3)
+    assert list(merged) == [(0x0A000000, 22), (0x0A010000, 24), (0x0A030000, 24)]
+    assert extra == 512
+
+    rng = random.Random(17)
+    prefixes = [(rng.getrandbits(12) << 20 >> rng.randint(0, 6), rng.randint(10, 24)) for _ in range(300)]
+    prefixes = [(addr & (0xFFFFFFFF ^ (0xFFFFFFFF >> plen)), plen) for addr, plen in prefixes]
+    exact = gen_core._aggregate(prefixes)
+    for budget in (1, 7, 50, len(exact)):
+        merged, extra = gen_core._aggregate_to_budget(prefixes, budget)
+        assert len(merged) <= budget
+        assert extra == _addresses(merged) - _addresses(exact)
+        assert gen_core._aggregate(merged.union(exact)) == merged
+
+
+@responses.activate
+def test_collapse_aggregate_cli_with_budget(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    _write_url_resource(tmp_path, "aws", "https://example.com/aws.txt", "plain_cidr")
+    body = "1.178.4.0/24\n1.178.5.0/24\n1.178.5.128/25\n1.178.8.0/24\n"
+    responses.add(responses.GET, "https://example.com/aws.txt", body=body)
+    responses.add(responses.GET, "https://example.com/aws.txt", body=body)
+
+    args = ["generate", "--resource", "aws", "--base-dir", str(tmp_path), "--collapse", "aggregate"]
+    assert main(args) == 0
+    path = tmp_path / "dist" / "aws.rsc"
+    assert [line.split()[3] for line in _read_add_lines(path)] == [
+        "address=1.178.4.0/23",
+        "address=1.178.8.0/24",
+    ]
+    assert "overcovered=0" in capsys.readouterr().out
+
+    assert main(args + ["--max-entries", "1"]) == 0
+    assert [line.split()[3] for line in _read_add_lines(path)] == ["address=1.178.0.0/20"]
+    assert f"overcovered={4096 - 768}" in capsys.readouterr().out
+
+    assert main(["generate", "--resource", "aws", "--base-dir", str(tmp_path), "--max-entries", "1"]) == 2
+
+
+@responses.activate
+def test_dist_formats_written_from_the_same_list(tmp_path: Path) -> None:
+    _write_url_resource(tmp_path, "aws", "https://example.com/aws.txt", "plain_cidr")
+    responses.add(responses.GET, "https://example.com/aws.txt", body="9.9.9.9/32\n1.2.3.0/24\n")
+    responses.add(responses.GET, "https://example.com/aws.txt", body="9.9.9.9/32\n1.2.3.0/24\n")
+    responses.add(responses.GET, "https://example.com/aws.txt", body="1.2.3.0/24\n")
+    dist = tmp_path / "dist"
+    args = ["generate", "--resource", "aws", "--base-dir", str(tmp_path)]
+
+    assert main(args + ["--formats", "txt,nft,ipset,bin"]) == 0
+    digest = gen_core._rsc_header((dist / "aws.rsc").read_text().splitlines(), "sha256")
+    assert (dist / "aws.txt").read_text() == "1.2.3.0/24\n9.9.9.9/32\n"
+    assert (dist / "aws.nft").read_text() == (
+        f"# iplist resource=aws count=2 sha256={digest}\n"
+        "define iplist_aws = {\n  1.2.3.0/24,\n  9.9.9.9/32\n}\n"
+    )
+    assert (dist / "aws.ipset").read_text().splitlines() == [
+        "create iplist_aws hash:net family inet maxelem 65536 -exist",
+        "add iplist_aws 1.2.3.0/24 -exist",
+        "add iplist_aws 9.9.9.9/32 -exist",
+    ]
+    data = (dist / "aws.bin").read_bytes()
+    assert data[:9] == b"IPLB\x01\x00\x00\x00\x02"
+    assert data[9:41].hex() == digest
+    assert data[41:] == bytes([1, 2, 3, 0, 24, 9, 9, 9, 9, 32])
+    assert not list(dist.glob("*.tmp"))
+
+    assert main(args + ["--formats", "txt"]) == 0
+    assert (dist / "aws.nft").exists()
+    assert main(args + ["--formats", "txt"]) == 0
+    assert (dist / "aws.txt").read_text() == "1.2.3.0/24\n"
+    assert not (dist / "aws.nft").exists() and not (dist / "aws.bin").exists()
+    with pytest.raises(SystemExit):
+        main(args + ["--formats", "txt,yaml"])
+
+
+@responses.activate
+def test_compact_rsc_style_round_trips(tmp_path: Path) -> None:
+    _write_url_resource(tmp_path, "aws", "https://example.com/aws.txt", "plain_cidr")
+    for _ in range(3):
+        responses.add(responses.GET, "https://example.com/aws.txt", body="9.9.9.9/32\n1.2.3.0/24\n")
+    path = tmp_path / "dist" / "aws.rsc"
+
+    full = generate_resource("aws", tmp_path)
+    full_text = full.read_text()
+    result = ResourceResult(resource_id="aws")
+    generate_resource("aws", tmp_path, rsc_style="compact", result=result)
+    assert result.changed
+    lines = path.read_text().splitlines()
+    assert lines[6:] == [
+        ":global AddressList",
+        "/ip/firewall/address-list",
+        'add list=$AddressList address=1.2.3.0/24 comment="iplist:auto:aws"',
+        'add list=$AddressList address=9.9.9.9 comment="iplist:auto:aws"',
+    ]
+    assert len(path.read_text()) < len(full_text)
+    published = gen_core._read_published_rsc("aws", path)
+    assert published is not None
+    assert list(published[1]) == [(0x01020300, 24), (0x09090909, 32)]
+    assert published[0] == gen_core._rsc_header(full_text.splitlines(), "sha256")
+
+    result = ResourceResult(resource_id="aws")
+    generate_resource("aws", tmp_path, rsc_style="compact", result=result)
+    assert not result.changed
+
+    bundle = gen_core.generate_bundle("bundle_x", ["aws"], tmp_path, rsc_style="compact")
+    assert bundle.read_text().splitlines()[8] == "/ip/firewall/address-list"
+
+    check = gen_core._RscCheck({"aws"})
+    for line in ("# count=1", ":global AddressList", "/ip/firewall/address-list"):
+        check.feed(line)
+    with pytest.raises(GeneratorError):
+        check.feed("remove [find list=$AddressList]")
+
+
+@responses.activate
+def test_chunked_parts_and_manifest_follow_the_list(tmp_path: Path) -> None:
+    _write_url_resource(tmp_path, "aws", "https://example.com/aws.txt", "plain_cidr")
+    five = "".join(f"10.0.{i}.0/24\n" for i in range(5))
+    for body in (five, five, five, "10.0.0.0/24\n10.0.1.0/24\n", "10.0.0.0/24\n"):
+        responses.add(responses.GET, "https://example.com/aws.txt", body=body)
+    dist = tmp_path / "dist"
+
+    generate_resource("aws", tmp_path, rsc_style="compact", chunk_entries=2)
+    full = (dist / "aws.rsc").read_text().splitlines()
+    digest = gen_core._rsc_header(full, "sha256")
+    parts = sorted(p.name for p in dist.glob("aws.part*.rsc"))
+    assert parts == ["aws.part01.rsc", "aws.part02.rsc", "aws.part03.rsc"]
+    manifest = (dist / "aws.manifest.rsc").read_text().splitlines()
+    assert manifest[0] == "# iplist-manifest v1"
+    assert manifest[3:] == [
+        f"# sha256={digest}",
+        "# count=5",
+        "# chunk_entries=2",
+        f"# max_bytes={gen_core.MAX_PART_BYTES}",
+        "# parts=3",
+    ]
+
+    added = []
+    for index, name in enumerate(parts, start=1):
+        lines = (dist / name).read_text().splitlines()
+        assert lines[:5] == [
+            "# iplist-rsc-part v1",
+            "# resource=aws",
+            f"# part={index}/3",
+            f"# sha256={digest}",
+            f"# count={2 if index < 3 else 1}",
+        ]
+        assert lines[6:8] == [":global AddressList", "/ip/firewall/address-list"]
+        added += lines[8:]
+    assert added == full[full.index("/ip/firewall/address-list") + 1 :]
+    assert not list(dist.glob("*.tmp"))
+
+    # Unchanged list and chunk size: nothing is rewritten.
+    mtime = (dist / "aws.part01.rsc").stat().st_mtime_ns
+    result = ResourceResult(resource_id="aws")
+    generate_resource("aws", tmp_path, rsc_style="compact", chunk_entries=2, result=result)
+    assert not result.changed
+    assert (dist / "aws.part01.rsc").stat().st_mtime_ns == mtime
+
+    # A new chunk size re-splits the same list.
+    args = ["generate", "--resource", "aws", "--base-dir", str(tmp_path), "--rsc-style", "compact"]
+    assert main(args + ["--chunk-entries", "4"]) == 0
+    assert len(gen_core._chunk_files(dist, "aws")) == 2
+
+    # A shorter list leaves no stale parts behind; turning chunking off removes them all.
+    generate_resource("aws", tmp_path, rsc_style="compact", chunk_entries=1)
+    assert [p.name for p in gen_core._chunk_files(dist, "aws")] == ["aws.part01.rsc", "aws.part02.rsc"]
+    gen_core.generate_bundle("bundle_x", ["aws"], tmp_path, chunk_entries=1)
+    bundle_part = (dist / "bundle_x.part02.rsc").read_text().splitlines()
+    assert bundle_part[2] == "# part=2/2"
+    assert bundle_part[-1].endswith('comment="iplist:auto:aws"')
+    generate_resource("aws", tmp_path, rsc_style="compact")
+    assert not gen_core._chunk_files(dist, "aws")
+    assert not (dist / "aws.manifest.rsc").exists()
+
+
+@responses.activate
+def test_chunked_parts_stay_under_the_router_contents_limit(tmp_path: Path) -> None:
+    # Same settings as CI: 2000 entries per part would be ~150 KB of compact lines.
+    _write_url_resource(tmp_path, "aws", "https://example.com/aws.txt", "plain_cidr")
+    body = "".join(f"10.{i >> 8}.{i & 0xFF}.0/24\n" for i in range(5000))
+    responses.add(responses.GET, "https://example.com/aws.txt", body=body)
+
+    generate_resource("aws", tmp_path, rsc_style="compact", chunk_entries=2000)
+    parts = gen_core._chunk_files(tmp_path / "dist", "aws")
+    assert len(parts) > 3
+    assert max(part.stat().st_size for part in parts) <= gen_core.MAX_PART_BYTES
+    counts = [int(gen_core._rsc_header(p.read_text().splitlines(), "count")) for p in parts]
+    assert sum(counts) == 5000 and max(counts) < 2000
+
+
+@responses.activate
+def test_list_needing_more_than_99_parts_is_published_unchunked(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    _write_url_resource(tmp_path, "aws", "https://example.com/aws.txt", "plain_cidr")
+    body = "".join(f"10.0.{i}.0/24\n" for i in range(100))
+    for _ in range(3):
+        responses.add(responses.GET, "https://example.com/aws.txt", body=body)
+    dist = tmp_path / "dist"
+
+    generate_resource("aws", tmp_path, chunk_entries=2)
+    assert len(gen_core._chunk_files(dist, "aws")) == 50
+
+    result = ResourceResult(resource_id="aws")
+    generate_resource("aws", tmp_path, chunk_entries=1, result=result)
+    assert result.changed
+    assert "event=chunks_skipped resource=aws count=100 parts=100 max_parts=99" in capsys.readouterr().out
+    assert len(_read_add_lines(dist / "aws.rsc")) == 100
+    assert not gen_core._chunk_files(dist, "aws")
+    manifest = (dist / "aws.manifest.rsc").read_text().splitlines()
+    assert "# parts=0" in manifest and "# count=100" in manifest
+    assert not list(dist.glob("*.tmp"))
+
+    # The skip is remembered: an unchanged list is not rewritten next run.
+    result = ResourceResult(resource_id="aws")
+    generate_resource("aws", tmp_path, chunk_entries=1, result=result)
+    assert not result.changed
+    with pytest.raises(GeneratorError):
+        generate_resource("aws", tmp_path, chunk_entries=0)
+
+
+def test_analyze_shadowed_matches_pairwise_scan() -> None:
+    rng = random.Random(11)
+    nets = [
+        ipaddress.ip_network((rng.getrandbits(12) << 20, rng.randint(4, 24)), strict=False)
+        for _ in range(300)
+    ]
+    nets += nets[:20]
+    ordered = sorted(nets, key=lambda n: (n.prefixlen, int(n.network_address)))
+    expected_count = 0
+    expected: dict[str, int] = {}
+    for idx, net in enumerate(ordered):
+        supernet = next((other for other in ordered[:idx] if net.subnet_of(other)), None)
+        if supernet is not None:
+            expected_count += 1
+            expected[str(supernet)] = expected.get(str(supernet), 0) + 1
+
+    assert analyze_shadowed_prefixes(nets) == (expected_count, expected)
+
+
+@responses.activate
+def test_analyze_command_reports_offenders(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    _write_resource(tmp_path)
+    responses.add(
+        responses.GET,
+        RIPESTAT_URL,
+        json={
+            "data": {
+                "prefixes": [
+                    {"prefix": "149.154.160.0/22"},
+                    {"prefix": "149.154.160.0/23"},
+                    {"prefix": "149.154.162.0/23"},
+                    {"prefix": "1.1.1.0/24"},
+                ]
+            }
+        },
+        status=200,
+        match=[responses.matchers.query_param_matcher({"resource": "AS13335"})],
+    )
+
+    rc = main(["analyze", "--resource", "cloudflare", "--base-dir", str(tmp_path)])
+
+    out = capsys.readouterr().out.splitlines()
+    assert rc == 0
+    assert out[0] == "resource=cloudflare total=4 shadowed=2 offenders=1"
+    assert out[1] == "offender=149.154.160.0/22 shadowed=2"
+    assert not (tmp_path / "dist" / "cloudflare.rsc").exists()
+
+
 @responses.activate
 def test_collapse_none_no_change(tmp_path: Path) -> None:
     _write_resource(tmp_path)
@@ -765,14 +1678,14 @@ def test_url_no_cache_fails(tmp_path: Path) -> None:
     def _raise(*_args, **_kwargs):
         raise requests.exceptions.Timeout()
 
-    original = requests.get
-    requests.get = _raise
+    original = requests.Session.get
+    requests.Session.get = _raise
     try:
         with pytest.raises(GeneratorError):
             generate_resource("aws", tmp_path, allow_cache=False)
         assert target.read_text() == "OLD"
     finally:
-        requests.get = original
+        requests.Session.get = original
 
 
 @responses.activate
@@ -809,18 +1722,17 @@ def test_url_allow_cache_timeout_fails(tmp_path: Path) -> None:
     def _raise(*_args, **_kwargs):
         raise requests.exceptions.Timeout()
 
-    original = requests.get
-    requests.get = _raise
+    original = requests.Session.get
+    requests.Session.get = _raise
     try:
         with pytest.raises(GeneratorError):
             generate_resource("fastly", tmp_path, allow_cache=True)
     finally:
-        requests.get = original
+        requests.Session.get = original
 
 
 @responses.activate
 def test_url_allow_stale_cache_non_200_uses_cache(tmp_path: Path) -> None:
-    reset_stale_cache_used()
     _write_url_resource(
         tmp_path, resource_id="fastly", url="https://example.com/fastly.json", feed_format="fastly_public_ip_list_json"
     )
@@ -836,14 +1748,14 @@ def test_url_allow_stale_cache_non_200_uses_cache(tmp_path: Path) -> None:
         status=403,
     )
 
-    path = generate_resource("fastly", tmp_path, allow_stale_cache=True)
+    result = ResourceResult(resource_id="fastly")
+    path = generate_resource("fastly", tmp_path, allow_stale_cache=True, result=result)
     add_lines = [line for line in _read_add_lines(path) if line.startswith("/ip/firewall/address-list add")]
     assert len(add_lines) == 1
-    assert stale_cache_used()
+    assert result.stale_cache_used
 
 
 def test_url_allow_stale_cache_timeout_uses_cache(tmp_path: Path) -> None:
-    reset_stale_cache_used()
     _write_url_resource(
         tmp_path, resource_id="fastly", url="https://example.com/fastly.json", feed_format="fastly_public_ip_list_json"
     )
@@ -856,15 +1768,174 @@ def test_url_allow_stale_cache_timeout_uses_cache(tmp_path: Path) -> None:
     def _raise(*_args, **_kwargs):
         raise requests.exceptions.Timeout()
 
-    original = requests.get
-    requests.get = _raise
+    original = requests.Session.get
+    requests.Session.get = _raise
     try:
-        path = generate_resource("fastly", tmp_path, allow_stale_cache=True)
+        result = ResourceResult(resource_id="fastly")
+        path = generate_resource("fastly", tmp_path, allow_stale_cache=True, result=result)
         add_lines = [line for line in _read_add_lines(path) if line.startswith("/ip/firewall/address-list add")]
         assert len(add_lines) == 1
-        assert stale_cache_used()
+        assert result.stale_cache_used
     finally:
-        requests.get = original
+        requests.Session.get = original
+
+
+@responses.activate
+def test_generate_all_parallel_isolates_failures(tmp_path: Path) -> None:
+    _write_resource(tmp_path, asns=["AS1"], resource_id="alpha")
+    _write_resource(tmp_path, asns=["AS2"], resource_id="beta")
+    _write_url_resource(
+        tmp_path, resource_id="gamma", url="https://example.com/gamma.json", feed_format="aws_ip_ranges_json"
+    )
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    (cache_dir / "gamma.json").write_text('{"prefixes":[{"ip_prefix":"3.5.140.0/22"}]}')
+    dist = tmp_path / "dist"
+    dist.mkdir(parents=True, exist_ok=True)
+    (dist / "beta.rsc").write_text("OLD")
+
+    responses.add(
+        responses.GET,
+        RIPESTAT_URL,
+        json={"data": {"prefixes": [{"prefix": "1.1.1.0/24"}, {"prefix": "1.1.2.0/24"}]}},
+        status=200,
+        match=[responses.matchers.query_param_matcher({"resource": "AS1"})],
+    )
+    responses.add(
+        responses.GET,
+        RIPESTAT_URL,
+        status=500,
+        match=[responses.matchers.query_param_matcher({"resource": "AS2"})],
+    )
+    responses.add(responses.GET, "https://example.com/gamma.json", status=503)
+
+    results = generate_all(tmp_path, allow_stale_cache=True, jobs=3)
+
+    assert [r.resource_id for r in results] == ["alpha", "beta", "gamma"]
+    assert [r.ok for r in results] == [True, False, True]
+    assert results[0].count == 2
+    assert not results[0].stale_cache_used
+    assert results[2].stale_cache_used
+    assert (dist / "beta.rsc").read_text() == "OLD"
+    assert not list(dist.glob("*.tmp"))
+
+
+def test_generate_all_records_unexpected_errors_per_resource(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    for resource_id in ("alpha", "beta", "gamma"):
+        _write_resource(tmp_path, asns=["AS1"], resource_id=resource_id)
+
+    def _generate(resource_id, base_dir, result=None, **options):
+        if resource_id == "beta":
+            raise OSError(28, "No space left on device")
+        result.count = 1
+        return base_dir / "dist" / f"{resource_id}.rsc"
+
+    monkeypatch.setattr(gen_core, "generate_resource", _generate)
+    results = generate_all(tmp_path, jobs=3)
+
+    assert [r.ok for r in results] == [True, False, True]
+    assert results[1].error == "OSError: [Errno 28] No space left on device"
+
+
+@responses.activate
+def test_generate_all_cli_prints_summary_and_fails(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    _write_resource(tmp_path, asns=["AS1"], resource_id="alpha")
+    _write_resource(tmp_path, asns=["AS2"], resource_id="beta")
+    responses.add(
+        responses.GET,
+        RIPESTAT_URL,
+        json={"data": {"prefixes": [{"prefix": "1.1.1.0/24"}]}},
+        status=200,
+        match=[responses.matchers.query_param_matcher({"resource": "AS1"})],
+    )
+    responses.add(
+        responses.GET,
+        RIPESTAT_URL,
+        status=500,
+        match=[responses.matchers.query_param_matcher({"resource": "AS2"})],
+    )
+
+    rc = main(
+        ["generate", "--all", "--jobs", "2", "--backoff-base", "0", "--base-dir", str(tmp_path)]
+    )
+
+    out = capsys.readouterr().out
+    assert rc == 1
+    assert "event=resource_done resource=alpha status=ok count=1 changed=true" in out
+    assert "event=resource_done resource=beta status=failed" in out
+    assert "resources=2 ok=1 failed=1 entries=1 changed=1" in out
+    assert "failed_resources=beta" in out
+    assert "changed_resources=alpha" in out
+    assert (tmp_path / "dist" / "alpha.rsc").exists()
+
+
+def test_http_client_reuses_connections_and_negotiates_gzip(tmp_path: Path) -> None:
+    seen_encodings = []
+
+    def _handle(handler):
+        seen_encodings.append(handler.headers.get("Accept-Encoding"))
+        body = gzip.compress(b"1.1.1.0/24\n1.0.0.0/24\n")
+        return 200, {"Content-Encoding": "gzip"}, body
+
+    with _local_server(_handle) as base_url:
+        _write_url_resource(tmp_path, "one", f"{base_url}/one.txt", "plain_cidr")
+        _write_url_resource(tmp_path, "two", f"{base_url}/two.txt", "plain_cidr")
+        with HttpClient() as client:
+            results = generate_all(tmp_path, client=client)
+            stats = client.stats()
+
+    assert [r.count for r in results] == [2, 2]
+    assert stats == {"requests": 2, "connections": 1, "reused": 1}
+    assert all(enc is not None and "gzip" in enc for enc in seen_encodings)
+
+
+def test_retries_are_spaced_by_backoff_and_retry_after(tmp_path: Path) -> None:
+    arrivals: list[float] = []
+
+    def _handle(handler):
+        arrivals.append(time.monotonic())
+        if len(arrivals) == 1:
+            return 503, {}, b""
+        if len(arrivals) == 2:
+            return 429, {"Retry-After": "1"}, b""
+        return 200, {}, b"1.1.1.0/24\n"
+
+    policy = RetryPolicy(retries=3, backoff_base=0.2, backoff_max=5.0, budget=30.0)
+    with _local_server(_handle) as base_url:
+        _write_url_resource(tmp_path, "cloudflare", f"{base_url}/cf.txt", "plain_cidr")
+        with HttpClient(retry=policy) as client:
+            generate_resource("cloudflare", tmp_path, client=client)
+
+    assert len(arrivals) == 3
+    assert arrivals[1] - arrivals[0] >= 0.1
+    assert arrivals[2] - arrivals[1] >= 1.0
+
+
+def test_retry_after_beyond_budget_fails_fast(tmp_path: Path) -> None:
+    arrivals: list[float] = []
+
+    def _handle(handler):
+        arrivals.append(time.monotonic())
+        return 503, {"Retry-After": "120"}, b""
+
+    dist = tmp_path / "dist"
+    dist.mkdir(parents=True, exist_ok=True)
+    (dist / "cloudflare.rsc").write_text("OLD")
+    policy = RetryPolicy(retries=3, backoff_base=0.0, budget=2.0)
+    with _local_server(_handle) as base_url:
+        _write_url_resource(tmp_path, "cloudflare", f"{base_url}/cf.txt", "plain_cidr")
+        started = time.monotonic()
+        with HttpClient(retry=policy) as client:
+            with pytest.raises(GeneratorError):
+                generate_resource("cloudflare", tmp_path, client=client)
+
+    assert len(arrivals) == 1
+    assert time.monotonic() - started < 2.0
+    assert (dist / "cloudflare.rsc").read_text() == "OLD"
 
 
 @responses.activate
@@ -890,6 +1961,105 @@ def test_telegram_uses_official_cidr_feed(tmp_path: Path) -> None:
     assert any("address=149.154.160.0/20" in line for line in add_lines)
 
 
+@responses.activate
+def test_delta_rsc_against_previous_dist(tmp_path: Path) -> None:
+    _write_url_resource(tmp_path, "telegram", "https://example.com/cidr.txt", "plain_cidr")
+    responses.add(
+        responses.GET, "https://example.com/cidr.txt", body="1.1.1.0/24\n2.2.2.2/32\n", status=200
+    )
+    responses.add(
+        responses.GET, "https://example.com/cidr.txt", body="1.1.1.0/24\n3.3.3.0/24\n", status=200
+    )
+
+    path = generate_resource("telegram", tmp_path)
+    delta_path = tmp_path / "dist" / "telegram.delta.rsc"
+    assert not delta_path.exists()
+    first = path.read_text().splitlines()
+
+    generate_resource("telegram", tmp_path)
+    second = path.read_text().splitlines()
+    delta = delta_path.read_text().splitlines()
+    assert delta[0] == "# iplist-rsc-delta v1"
+    assert "# base=" + gen_core._rsc_header(first, "sha256") in delta
+    assert "# sha256=" + gen_core._rsc_header(second, "sha256") in delta
+    assert "# count=2" in delta
+    changes = [line for line in delta if line.startswith("/ip/firewall/address-list ")]
+    assert changes == [
+        '/ip/firewall/address-list add list=$AddressList address=3.3.3.0/24 '
+        'comment="iplist:auto:telegram"',
+        '/ip/firewall/address-list remove [find list=$AddressList address="2.2.2.2" '
+        'comment="iplist:auto:telegram"]',
+    ]
+
+    responses.add(
+        responses.GET, "https://example.com/cidr.txt", body="3.3.3.0/24\n1.1.1.0/24\n", status=200
+    )
+    result = ResourceResult(resource_id="telegram")
+    generate_resource("telegram", tmp_path, result=result)
+    assert not result.changed
+    assert path.read_text().splitlines() == second
+    assert delta_path.read_text().splitlines() == delta
+
+    # Rewriting the same list in another style (or with more formats) keeps
+    # the delta that leads to it, instead of an empty one from itself.
+    responses.add(
+        responses.GET, "https://example.com/cidr.txt", body="3.3.3.0/24\n1.1.1.0/24\n", status=200
+    )
+    generate_resource("telegram", tmp_path, result=result, rsc_style="compact", formats=["txt"])
+    assert result.changed
+    assert delta_path.read_text().splitlines() == delta
+    second = path.read_text().splitlines()
+
+    # Files published before the sha256 header existed are rewritten once.
+    path.write_text("\n".join(line for line in second if not line.startswith("# sha256=")) + "\n")
+    responses.add(
+        responses.GET, "https://example.com/cidr.txt", body="1.1.1.0/24\n3.3.3.0/24\n", status=200
+    )
+    generate_resource("telegram", tmp_path, result=result)
+    assert result.changed
+    assert "# sha256=" + gen_core._rsc_header(second, "sha256") in path.read_text().splitlines()
+
+    (tmp_path / "dist" / "telegram.rsc").write_text("OLD")
+    responses.add(responses.GET, "https://example.com/cidr.txt", body="1.1.1.0/24\n", status=200)
+    generate_resource("telegram", tmp_path)
+    assert not delta_path.exists()
+
+
+def test_delta_diff_streams_sorted_files_and_falls_back_for_others(tmp_path: Path) -> None:
+    resource = gen_core.ResourceConfig(
+        resource_id="aws", source_type="url", asns=None, url="https://example.com", format="plain_cidr"
+    )
+    old = PrefixSet([(0x01010100, 24), (0x02020202, 32), (0x05050500, 24)])
+    new = PrefixSet([(0x01010100, 24), (0x03030300, 24), (0x05050500, 24), (0x06060600, 24)])
+    path = tmp_path / "aws.rsc"
+    gen_core._write_checked_rsc(
+        path, gen_core._render_rsc(resource, old, gen_core._prefix_digest(old), "compact"), {"aws"}
+    )
+    expected = (
+        gen_core._prefix_digest(old),
+        PrefixSet([(0x03030300, 24), (0x06060600, 24)]),
+        PrefixSet([(0x02020202, 32)]),
+    )
+    assert gen_core._diff_published(path, new) == expected
+
+    # Hand-edited files may be out of order or repeat entries.
+    lines = path.read_text().splitlines()
+    path.write_text("\n".join(lines[:8] + lines[8:][::-1] + lines[8:9]) + "\n")
+    assert gen_core._diff_published(path, new) == expected
+
+    # Deciding that nothing changed reads only the header.
+    path.write_text("\n".join(lines + ["add list=$AddressList address=nope"]) + "\n")
+    assert gen_core._read_rsc_header("aws", path) == (gen_core._prefix_digest(old), "compact")
+    assert gen_core._diff_published(path, new) is None
+
+    check = gen_core._DeltaCheck(resource)
+    for line in ("# iplist-rsc-delta v1", "# base=x", "# sha256=y", "# added=1", "# removed=0"):
+        check.feed(line)
+    check.feed(":global AddressList")
+    with pytest.raises(GeneratorError, match="added header mismatch"):
+        check.finish()
+
+
 @responses.activate
 def test_dedup_and_order(tmp_path: Path) -> None:
     _write_resource(tmp_path)
@@ -956,15 +2126,15 @@ def test_self_check_blocks_bad_rsc(tmp_path: Path, monkeypatch: pytest.MonkeyPat
         match=[responses.matchers.query_param_matcher({"resource": "AS13335"})],
     )
 
-    def _bad_render(resource, networks) -> str:
-        return (
-            "# iplist-rsc v1\n"
-            "# resource=cloudflare\n"
-            "# generated=2026-01-30T00:00:00Z\n"
-            "# count=2\n"
-            "\n"
+    def _bad_render(resource, networks, digest, style):
+        yield "# iplist-rsc v1"
+        yield "# resource=cloudflare"
+        yield "# generated=2026-01-30T00:00:00Z"
+        yield "# count=2"
+        yield ""
+        yield (
             "/ip/firewall/address-list add list=blacklist_eu address=1.1.1.0/24 "
-            "comment=\"iplist:auto:cloudflare\"\n"
+            "comment=\"iplist:auto:cloudflare\""
         )
 
     monkeypatch.setattr(gen_core, "_render_rsc", _bad_render)
@@ -975,6 +2145,41 @@ def test_self_check_blocks_bad_rsc(tmp_path: Path, monkeypatch: pytest.MonkeyPat
     assert target.read_text() == "OLD"
 
 
+@responses.activate
+def test_streamed_self_check_fails_mid_write(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _write_resource(tmp_path)
+    dist = tmp_path / "dist"
+    dist.mkdir(parents=True, exist_ok=True)
+    target = dist / "cloudflare.rsc"
+    target.write_text("OLD")
+    responses.add(
+        responses.GET,
+        RIPESTAT_URL,
+        json={"data": {"prefixes": [{"prefix": "1.1.1.0/24"}]}},
+        status=200,
+    )
+    render = gen_core._render_rsc
+    written = []
+
+    def _render_then_remove(resource, networks, digest, style):
+        for line in render(resource, networks, digest, style):
+            written.append(line)
+            yield line
+        yield "/ip/firewall/address-list remove [find list=$AddressList]"
+        written.append("never reached")
+
+    monkeypatch.setattr(gen_core, "_render_rsc", _render_then_remove)
+
+    with pytest.raises(GeneratorError):
+        generate_resource("cloudflare", tmp_path)
+
+    assert written[-1].startswith("/ip/firewall/address-list add ")
+    assert target.read_text() == "OLD"
+    assert not (dist / "cloudflare.rsc.tmp").exists()
+
+
 @responses.activate
 @pytest.mark.parametrize(
     "resource_id,asn",
@@ -1019,3 +2224,256 @@ def test_generated_rsc_has_addresslist_and_no_remove(
     assert all("list=$AddressList" in line for line in add_lines)
     assert all(f'comment="iplist:auto:{resource_id}"' in line for line in add_lines)
     assert all("/ip/firewall/address-list remove" not in line for line in lines)
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Removal block of the loaders before it used a filtered find.
+_SCAN_REMOVAL = """
+:local tag ("iplist:auto:" . $resource)
+:foreach i in=[/ip/firewall/address-list find] do={
+  :if ([/ip/firewall/address-list get $i comment] = $tag) do={
+    /ip/firewall/address-list remove $i
+  }
+}
+"""
+
+
+class _AddressListSim:
+    """Just enough RouterOS script to run a loader's removal block.
+
+    `commands` counts script-level address-list commands; a filtered find is
+    one command however many entries it matches.
+    """
+
+    def __init__(self, entries: list[dict[str, str]]) -> None:
+        self.entries = {f"*{idx}": entry for idx, entry in enumerate(entries)}
+        self.commands = 0
+
+    def _value(self, token: str, env: dict[str, str]) -> str:
+        token = token.strip()
+        if token.startswith("$"):
+            return env[token[1:]]
+        if token.startswith("("):
+            return "".join(self._value(part, env) for part in token[1:-1].split(" . "))
+        return token.strip('"')
+
+    def _find(self, filters: str, env: dict[str, str]) -> list[str]:
+        self.commands += 1
+        wanted = [
+            (key, op, self._value(value, env))
+            for key, op, value in re.findall(r'(\w+)([=~])("[^"]*"|\$\w+)', filters)
+        ]
+        return [
+            ident
+            for ident, entry in self.entries.items()
+            if all(
+                entry.get(key) == value if op == "=" else re.search(value, entry.get(key, ""))
+                for key, op, value in wanted
+            )
+        ]
+
+    @staticmethod
+    def _statements(script: str) -> list[str]:
+        statements, depth, current = [], 0, ""
+        for line in script.strip().splitlines():
+            current += line.strip() + "\n"
+            depth += line.count("{") - line.count("}")
+            if depth == 0 and current.strip():
+                statements.append(current.strip())
+                current = ""
+        return statements
+
+    def run(self, script: str, env: dict[str, str]) -> None:
+        for stmt in self._statements(script):
+            if stmt.startswith((":log ", "#")):
+                continue
+            if match := re.fullmatch(r":local (\w+) (.+)", stmt):
+                env[match.group(1)] = self._value(match.group(2), env)
+            elif match := re.fullmatch(
+                r":foreach (\w+) in=\[/ip/firewall/address-list find(.*?)\] do=\{(.*)\}", stmt, re.S
+            ):
+                for ident in self._find(match.group(2), env):
+                    self.run(match.group(3), {**env, match.group(1): ident})
+            elif match := re.fullmatch(
+                r":if \(\[/ip/firewall/address-list get \$(\w+) (\w+)\] = (\$\w+)\) do=\{(.*)\}",
+                stmt,
+                re.S,
+            ):
+                self.commands += 1
+                entry = self.entries[env[match.group(1)]]
+                if entry.get(match.group(2)) == self._value(match.group(3), env):
+                    self.run(match.group(4), env)
+            elif match := re.fullmatch(
+                r':if \(\$(\w+) ~ "([^"]*)"\) do=\{(.*)\} else=\{(.*)\}', stmt, re.S
+            ):
+                branch = 3 if re.search(match.group(2), env[match.group(1)]) else 4
+                self.run(match.group(branch), env)
+            elif match := re.fullmatch(r"/ip/firewall/address-list remove \[find(.*)\]", stmt):
+                for ident in self._find(match.group(1), env):
+                    del self.entries[ident]
+                self.commands += 1
+            elif match := re.fullmatch(r"/ip/firewall/address-list remove \$(\w+)", stmt):
+                self.commands += 1
+                del self.entries[env[match.group(1)]]
+            else:
+                raise AssertionError(f"unsupported statement: {stmt!r}")
+
+
+def _loader_removal_block(loader: str) -> str:
+    start = loader.index(":local tag (")
+    end = loader.index(":global AddressList $listName", start)
+    return loader[start:end]
+
+
+def test_committed_loaders_match_template() -> None:
+    template = (REPO_ROOT / "routeros" / "loader.rsc.in").read_text()
+    regions = load_regions(REPO_ROOT)
+    assert {r.region for r in regions} == {"eu", "ru"}
+    for region in regions:
+        rendered = render_loader(
+            template, region.region, region.list_name, region.resources, region.chunked
+        )
+        assert rendered == (REPO_ROOT / "routeros" / f"loader_{region.region}.rsc").read_text()
+    with pytest.raises(GeneratorError):
+        render_loader("{{NOPE}}", "eu", "blacklist_eu", [])
+    assert render_loader("{{CHUNKED}}", "eu", "blacklist_eu", [], chunked=True) == "true"
+    assert render_loader("{{CHUNKED}}", "eu", "blacklist_eu", []) == "false"
+
+
+def test_loader_state_is_per_list_and_checked_against_entry_count() -> None:
+    template = (REPO_ROOT / "routeros" / "loader.rsc.in").read_text()
+    assert ':local stateKey ($listName . ":" . $resource)' in template
+    # Two regions loading the same resource into different lists keep separate state.
+    assert "$iplistVersions->$resource" not in template
+    assert "$iplistCounts->$resource" not in template
+    assert template.count(":set ($iplistCounts->$stateKey) $count") == 3
+    # The entry count is verified before the recorded version can skip a full load.
+    check = template.index("($present != ($iplistCounts->$stateKey))")
+    assert check < template.index("fetching delta")
+    assert check < template.index("fetching manifest")
+
+
+def test_loaders_cli_renders_regions_with_cost(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    _write_resource(tmp_path, asns=["AS1"], resource_id="alpha")
+    _write_resource(tmp_path, asns=["AS2"], resource_id="beta")
+    (tmp_path / "routeros").mkdir()
+    (tmp_path / "routeros" / "loader.rsc.in").write_text(
+        (REPO_ROOT / "routeros" / "loader.rsc.in").read_text()
+    )
+    (tmp_path / "regions.yaml").write_text(
+        "regions:\n"
+        "  lab:\n"
+        "    list_name: blacklist_lab\n"
+        "    resources: [alpha, beta]\n"
+    )
+    dist = tmp_path / "dist"
+    dist.mkdir()
+    (dist / "alpha.rsc").write_text("# iplist-rsc v1\n# resource=alpha\n# count=3\n\n:global AddressList\n")
+
+    assert main(["loaders", "--base-dir", str(tmp_path)]) == 0
+    out = capsys.readouterr().out
+    size = (dist / "alpha.rsc").stat().st_size
+    assert (
+        f"event=loader_done region=lab path=routeros/loader_lab.rsc resources=2 "
+        f"entries=3 bytes={size} missing=beta"
+    ) in out
+    loader = (tmp_path / "routeros" / "loader_lab.rsc").read_text()
+    assert ':local listName "blacklist_lab"' in loader
+    assert 'iplist[LAB]: start' in loader
+    assert '  "alpha";\n  "beta"\n}' in loader
+
+    (tmp_path / "regions.yaml").write_text(
+        "regions:\n  lab:\n    list_name: blacklist_lab\n    resources: [gamma]\n"
+    )
+    assert main(["loaders", "--base-dir", str(tmp_path)]) == 1
+    assert "unknown resources for region lab: gamma" in capsys.readouterr().err
+
+
+def test_bundle_merges_region_resources_across_providers(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    _write_url_resource(tmp_path, "alpha", "https://example.com/alpha.txt", "plain_cidr")
+    _write_url_resource(tmp_path, "beta", "https://example.com/beta.txt", "plain_cidr")
+    (tmp_path / "regions.yaml").write_text(
+        "regions:\n"
+        "  lab:\n"
+        "    list_name: blacklist_lab\n"
+        "    resources: [alpha, beta]\n"
+        "    bundle: true\n"
+        "  plain:\n"
+        "    list_name: blacklist_plain\n"
+        "    resources: [alpha]\n"
+    )
+    with responses.RequestsMock() as mock:
+        mock.add(responses.GET, "https://example.com/alpha.txt", body="10.0.0.0/24\n20.0.0.0/24\n")
+        mock.add(responses.GET, "https://example.com/beta.txt", body="10.0.0.0/8\n20.0.0.0/24\n30.0.0.1/32\n")
+        generate_resource("alpha", tmp_path)
+        generate_resource("beta", tmp_path)
+
+    assert main(["bundles", "--base-dir", str(tmp_path)]) == 0
+    assert "event=resource_done resource=bundle_lab status=ok count=3 changed=true" in capsys.readouterr().out
+    # Regions without bundle: true get a bundle only when asked for by name.
+    assert not (tmp_path / "dist" / "bundle_plain.rsc").exists()
+    assert main(["bundles", "--base-dir", str(tmp_path), "--region", "plain"]) == 0
+    assert (tmp_path / "dist" / "bundle_plain.rsc").exists()
+    capsys.readouterr()
+    path = tmp_path / "dist" / "bundle_lab.rsc"
+    lines = path.read_text().splitlines()
+    assert "# resources=alpha,beta" in lines
+    # 10.0.0.0/24 (alpha) is shadowed by beta's /8; the shared /24 keeps alpha's tag.
+    assert _read_add_lines(path) == [
+        '/ip/firewall/address-list add list=$AddressList address=10.0.0.0/8 comment="iplist:auto:beta"',
+        '/ip/firewall/address-list add list=$AddressList address=20.0.0.0/24 comment="iplist:auto:alpha"',
+        '/ip/firewall/address-list add list=$AddressList address=30.0.0.1/32 comment="iplist:auto:beta"',
+    ]
+
+    assert main(["bundles", "--base-dir", str(tmp_path)]) == 0
+    assert "changed=false" in capsys.readouterr().out
+    assert path.read_text().splitlines() == lines
+
+    (tmp_path / "routeros").mkdir()
+    (tmp_path / "routeros" / "loader.rsc.in").write_text(
+        (REPO_ROOT / "routeros" / "loader.rsc.in").read_text()
+    )
+    assert main(["loaders", "--base-dir", str(tmp_path)]) == 0
+    assert "resources=1 entries=3" in capsys.readouterr().out
+    assert ':global resources {\n  "bundle_lab"\n}' in (tmp_path / "routeros" / "loader_lab.rsc").read_text()
+
+    (tmp_path / "dist" / "beta.rsc").unlink()
+    assert main(["bundles", "--base-dir", str(tmp_path)]) == 1
+    assert "no usable dist file for beta" in capsys.readouterr().err
+    assert path.read_text().splitlines() == lines
+
+
+def test_loader_removal_is_one_filtered_find_per_resource() -> None:
+    def _table() -> list[dict[str, str]]:
+        entries = [{"list": "other", "comment": f"manual:{i}"} for i in range(2000)]
+        entries += [{"list": "blacklist_eu", "comment": "iplist:auto:fastly"} for _ in range(200)]
+        entries += [{"list": "blacklist_eu", "comment": "iplist:auto:googlecloud"} for _ in range(100)]
+        entries.append({"list": "other", "comment": "iplist:auto:fastly"})
+        return entries
+
+    loader = render_loader(
+        (REPO_ROOT / "routeros" / "loader.rsc.in").read_text(), "eu", "blacklist_eu", []
+    )
+    filtered, scan = _AddressListSim(_table()), _AddressListSim(_table())
+    for resource in ("fastly", "googlecloud"):
+        env = {"listName": "blacklist_eu", "resource": resource}
+        filtered.run(_loader_removal_block(loader), dict(env))
+        scan.run(_SCAN_REMOVAL, dict(env))
+
+    assert filtered.commands == 4
+    # find + one get per entry + one remove per match, for each resource.
+    assert scan.commands == (1 + 2301 + 201) + (1 + 2100 + 100)
+    assert all(entry["list"] == "other" for entry in filtered.entries.values())
+    # Only the loader's own list is touched now; other lists keep their entries.
+    assert len(filtered.entries) == 2001
+    assert len(scan.entries) == 2000
+
+    bundle = _AddressListSim(_table())
+    bundle.run(_loader_removal_block(loader), {"listName": "blacklist_eu", "resource": "bundle_eu"})
+    assert bundle.commands == 2
+    assert len(bundle.entries) == 2001